@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import socket
+import argparse
+import threading
+import contextlib
+import contextvars
+import statistics
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Structured events are appended to this JSON-lines file, one object per
+# line. Empty (the default) only prints them; the file is never rotated, so
+# point it somewhere that gets cleaned up when leaving it on.
+EVENT_LOG_PATH = os.path.expanduser(os.getenv('EVENT_LOG_PATH', ''))
+# Lowest level written to the file, and the lowest printed to the console.
+EVENT_LEVEL = os.getenv('EVENT_LEVEL', 'debug')
+CONSOLE_LEVEL = os.getenv('CONSOLE_LEVEL', 'info')
+# Share of debug events kept. The per-element chatter of the hot loop is
+# debug, so at thousands of pages per hour most of it is sampled away.
+# Info and above are always kept.
+EVENT_SAMPLE = float(os.getenv('EVENT_SAMPLE', '0.1'))
+# Events waiting for the writer thread. When it falls behind, debug and
+# info events are dropped (and counted) rather than slowing downloads.
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', '10000'))
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Chapter, page and the like, set with context() and added to every event.
+_context = contextvars.ContextVar("event_context", default={})
+
+
+@contextlib.contextmanager
+def context(**fields):
+    """Add `fields` to every event emitted by this thread inside the block."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_context():
+    """Return the fields context() has set for this thread."""
+    return _context.get()
+
+
+class EventLog:
+    """Queues events and writes them from a background thread.
+
+    emit() only builds a dict and queues it; JSON encoding, file writes and
+    console output all happen on the writer thread.
+    """
+
+    def __init__(self, path=EVENT_LOG_PATH, level=EVENT_LEVEL, console_level=CONSOLE_LEVEL,
+                 sample=EVENT_SAMPLE, queue_size=EVENT_QUEUE_SIZE):
+        self.path = path
+        self.level = LEVELS[level]
+        self.console_level = LEVELS[console_level]
+        self.threshold = min(self.level, self.console_level)
+        self.sample = sample
+        self.node = f"{socket.gethostname()}/{os.getpid()}"
+        self.sampled_out = Counter()
+        self.dropped = Counter()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self._writer.start()
+
+    def emit(self, event, message=None, level="info", **fields):
+        number = LEVELS[level]
+        if number < self.threshold:
+            return
+        if number == LEVELS["debug"] and self.sample < 1 and random.random() >= self.sample:
+            self.sampled_out[event] += 1
+            return
+        record = {"ts": time.time(), "level": level, "event": event,
+                  "thread": threading.current_thread().name}
+        record.update(_context.get())
+        record.update(fields)
+        if message is not None:
+            record["msg"] = message
+        try:
+            if number >= LEVELS["warning"]:
+                self._queue.put(record, timeout=1)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[event] += 1
+
+    def _run(self):
+        out = None
+        if self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                out = open(self.path, "a", encoding="utf-8")
+            except OSError as e:
+                print(f"Could not open event log {self.path}: {e}")
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            number = LEVELS[record["level"]]
+            if number >= self.console_level and "msg" in record:
+                print(record["msg"])
+            if out is not None and number >= self.level:
+                record["node"] = self.node
+                out.write(json.dumps(record, default=str) + "\n")
+                if self._queue.empty():
+                    out.flush()
+        if out is not None:
+            out.close()
+
+    def close(self):
+        """Write what is queued, with counts of sampled and dropped events."""
+        if not self._writer.is_alive():
+            return
+        if self.sampled_out or self.dropped:
+            self._queue.put({"ts": time.time(), "level": "info", "event": "event_log_summary",
+                             "thread": threading.current_thread().name,
+                             "sampled_out": dict(self.sampled_out),
+                             "dropped": dict(self.dropped)})
+        self._queue.put(None)
+        self._writer.join(10)
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_event_log():
+    """Return the process-wide event log."""
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = EventLog()
+                atexit.register(_log.close)
+    return _log
+
+
+def emit(event, message=None, level="info", **fields):
+    """Record an event; `message` is also printed when the level is high enough."""
+    get_event_log().emit(event, message, level, **fields)
+
+
+def read_events(path, level="debug", **filters):
+    """Yield the events in a log file at or above `level` matching `filters`."""
+    minimum = LEVELS[level]
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if LEVELS.get(record.get("level"), 0) < minimum:
+                continue
+            if all(str(record.get(name)) == str(value) for name, value in filters.items()):
+                yield record
+
+
+def summarize(records):
+    """Print event counts and duration percentiles per event."""
+    counts = Counter()
+    durations = defaultdict(list)
+    for record in records:
+        counts[(record["event"], record["level"])] += 1
+        if isinstance(record.get("duration"), (int, float)):
+            durations[record["event"]].append(record["duration"])
+    for (event, level), count in sorted(counts.items()):
+        line = f"{event:<24}{level:<9}{count:>8}"
+        values = sorted(durations.get(event, ()))
+        if values:
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            line += (f"   p50 {statistics.median(values):.3f}s  p95 {p95:.3f}s"
+                     f"  max {values[-1]:.3f}s")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a structured event log.")
+    parser.add_argument("command", choices=("summary", "show"))
+    parser.add_argument("path", nargs="?", default=EVENT_LOG_PATH or None,
+                        help="event log to read (default: EVENT_LOG_PATH)")
+    parser.add_argument("--level", choices=LEVELS, default="debug")
+    parser.add_argument("--event")
+    parser.add_argument("--chapter")
+    parser.add_argument("--page")
+    parser.add_argument("--stage")
+    parser.add_argument("--since", type=float, help="only the last N hours")
+    args = parser.parse_args()
+    if args.path is None:
+        parser.error("no event log given and EVENT_LOG_PATH is not set")
+
+    filters = {name: value for name, value in (
+        ("event", args.event), ("chapter", args.chapter), ("page", args.page),
+        ("stage", args.stage)) if value is not None}
+    records = read_events(args.path, args.level, **filters)
+    if args.since is not None:
+        since = time.time() - args.since * 3600
+        records = (record for record in records if record["ts"] >= since)
+    if args.command == "summary":
+        summarize(records)
+    else:
+        for record in records:
+            sys.stdout.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import os
+import io
+import time
+import struct
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.sax.saxutils import escape
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    from PIL import Image
+except ImportError:  # Only needed for images that can't be embedded as-is
+    Image = None
+
+# Pages are laid out at this resolution when converted to PDF points.
+EXPORT_DPI = int(os.getenv('EXPORT_DPI', '96'))
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', str(os.cpu_count() or 2)))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def image_info(data):
+    """Return (format, width, height, details) by reading only the image header."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack(
+            ">IIBBBBB", data[16:29])
+        return "png", width, height, {
+            "bit_depth": bit_depth, "color_type": color_type, "interlace": interlace}
+
+    if data[:2] == b"\xff\xd8":
+        offset = 2
+        while offset + 4 <= len(data):
+            if data[offset] != 0xFF:
+                offset += 1
+                continue
+            marker = data[offset + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                offset += 2
+                continue
+            length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+            # SOF0-SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(
+                    ">HH", data[offset + 5:offset + 9])
+                return "jpeg", width, height, {"components": data[offset + 9]}
+            offset += 2 + length
+        raise ValueError("JPEG without a frame header")
+
+    raise ValueError("Unsupported image format")
+
+
+def iter_pages(source):
+    """Yield (name, bytes) for every page in a chapter folder or CBZ, in order.
+
+    Only one page is held in memory at a time.
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(source, name), "rb") as f:
+                    yield name, f.read()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for name in sorted(archive.namelist()):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield name, archive.read(name)
+    else:
+        raise ValueError(f"Not a chapter folder or CBZ: {source}")
+
+
+def _png_chunks(data):
+    """Yield (type, payload) for every chunk of a PNG file."""
+    offset = 8
+    while offset < len(data):
+        length = struct.unpack(">I", data[offset:offset + 4])[0]
+        chunk_type = data[offset + 4:offset + 8]
+        yield chunk_type, data[offset + 8:offset + 8 + length]
+        offset += 12 + length
+
+
+def _to_jpeg(data):
+    """Re-encode an image Pillow understands as a baseline RGB JPEG."""
+    if Image is None:
+        raise RuntimeError(
+            "Pillow is required to export this image format (pip install Pillow).")
+    with Image.open(io.BytesIO(data)) as image:
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, "JPEG", quality=90)
+        return buffer.getvalue()
+
+
+class PdfWriter:
+    """Write a PDF one page at a time, straight to disk.
+
+    Every object is flushed as soon as it is built; only the byte offsets
+    needed for the cross-reference table are kept, so memory use does not
+    grow with the number of pages.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = metadata or {}
+        self._tmp_path = path + ".part"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(self._tmp_path, "wb")
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 3  # 1 is the catalog, 2 the page tree
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _new_id(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _write_object(self, object_id, body, stream=None):
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode())
+        self._file.write(body)
+        if stream is not None:
+            self._file.write(b"\nstream\n")
+            self._file.write(stream)
+            self._file.write(b"\nendstream")
+        self._file.write(b"\nendobj\n")
+
+    def _image_object(self, data):
+        """Return (dictionary, stream, width, height) for an embeddable image."""
+        kind, width, height, details = image_info(data)
+        if kind == "png" and details["bit_depth"] == 8 and not details["interlace"] \
+                and details["color_type"] in (0, 2):
+            # Gray/RGB PNG data is a valid Flate stream with PNG predictors,
+            # so it can be copied without decoding.
+            colors = 1 if details["color_type"] == 0 else 3
+            color_space = "/DeviceGray" if colors == 1 else "/DeviceRGB"
+            stream = b"".join(
+                payload for chunk_type, payload in _png_chunks(data)
+                if chunk_type == b"IDAT")
+            dictionary = (
+                f"/Filter /FlateDecode /DecodeParms << /Predictor 15 "
+                f"/Colors {colors} /BitsPerComponent 8 /Columns {width} >> "
+                f"/ColorSpace {color_space}")
+            return dictionary, stream, width, height
+        if kind == "png" or details.get("components") not in (1, 3):
+            data = _to_jpeg(data)
+            kind, width, height, details = image_info(data)
+        color_space = "/DeviceGray" if details["components"] == 1 else "/DeviceRGB"
+        return f"/Filter /DCTDecode /ColorSpace {color_space}", data, width, height
+
+    def write_page(self, page_number, data):
+        dictionary, stream, width, height = self._image_object(data)
+        page_width = width * 72 / EXPORT_DPI
+        page_height = height * 72 / EXPORT_DPI
+
+        image_id = self._new_id()
+        self._write_object(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/BitsPerComponent 8 {dictionary} /Length {len(stream)} >>").encode(),
+            stream)
+
+        content = f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q".encode()
+        content_id = self._new_id()
+        self._write_object(content_id, f"<< /Length {len(content)} >>".encode(),
+                           content)
+
+        page_id = self._new_id()
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R "
+            f"/MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>").encode())
+        self._page_ids.append(page_id)
+        return f"{self.path}#page={len(self._page_ids)}"
+
+    def close(self):
+        """Write the page tree, info and xref, then move the PDF into place."""
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._write_object(2, (
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>").encode())
+
+        info_id = self._new_id()
+        title = self.metadata.get("title") or _volume_title(self.metadata)
+        title = title.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        self._write_object(info_id, f"<< /Title ({title}) >>".encode("latin-1", "replace"))
+
+        xref_offset = self._file.tell()
+        self._file.write(f"xref\n0 {self._next_id}\n".encode())
+        self._file.write(b"0000000000 65535 f \n")
+        for object_id in range(1, self._next_id):
+            self._file.write(f"{self._offsets[object_id]:010d} 00000 n \n".encode())
+        self._file.write((
+            f"trailer\n<< /Size {self._next_id} /Root 1 0 R /Info {info_id} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n").encode())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        print(f"PDF written: {self.path} ({len(self._page_ids)} pages)")
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class EpubWriter:
+    """Write a fixed-layout EPUB 3 one page at a time.
+
+    Images are streamed into the zip as they arrive; only the small manifest
+    entries are kept until close().
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = metadata or {}
+        self._tmp_path = path + ".part"
+        self._pages = []
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._archive = zipfile.ZipFile(self._tmp_path, "w")
+        # The mimetype entry must come first and be stored uncompressed.
+        self._archive.writestr("mimetype", "application/epub+zip",
+                               compress_type=zipfile.ZIP_STORED)
+        self._archive.writestr("META-INF/container.xml", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+            '  <rootfiles>\n'
+            '    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>\n'
+            '  </rootfiles>\n'
+            '</container>\n'), compress_type=zipfile.ZIP_DEFLATED)
+
+    def write_page(self, page_number, data):
+        kind, width, height, _ = image_info(data)
+        index = len(self._pages) + 1
+        extension = "png" if kind == "png" else "jpg"
+        image_name = f"images/{index:04d}.{extension}"
+        page_name = f"pages/{index:04d}.xhtml"
+
+        # Images are already compressed, don't spend CPU deflating them again.
+        self._archive.writestr(f"OEBPS/{image_name}", data,
+                               compress_type=zipfile.ZIP_STORED)
+        self._archive.writestr(f"OEBPS/{page_name}", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<!DOCTYPE html>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml">\n'
+            f'<head><title>Page {index}</title>'
+            f'<meta name="viewport" content="width={width}, height={height}"/>'
+            '<style>body{margin:0;padding:0}img{width:100%;height:100%}</style></head>\n'
+            f'<body><img src="../{image_name}" alt="Page {index}"/></body>\n'
+            '</html>\n'), compress_type=zipfile.ZIP_DEFLATED)
+        self._pages.append((image_name, page_name, kind))
+        return f"{self.path}:{page_name}"
+
+    def close(self):
+        """Write the package document and navigation, then move the EPUB into place."""
+        title = escape(self.metadata.get("title") or _volume_title(self.metadata))
+        language = escape(self.metadata.get("language") or "en")
+        identifier = escape(self.metadata.get("url") or self.path)
+
+        manifest = ['    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        spine = []
+        for index, (image_name, page_name, kind) in enumerate(self._pages, 1):
+            media_type = "image/png" if kind == "png" else "image/jpeg"
+            cover = ' properties="cover-image"' if index == 1 else ""
+            manifest.append(
+                f'    <item id="img{index}" href="{image_name}" media-type="{media_type}"{cover}/>')
+            manifest.append(
+                f'    <item id="page{index}" href="{page_name}" media-type="application/xhtml+xml"/>')
+            spine.append(f'    <itemref idref="page{index}"/>')
+
+        self._archive.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">\n'
+            '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+            f'    <dc:identifier id="uid">{identifier}</dc:identifier>\n'
+            f'    <dc:title>{title}</dc:title>\n'
+            f'    <dc:language>{language}</dc:language>\n'
+            f'    <meta property="dcterms:modified">{time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}</meta>\n'
+            '    <meta property="rendition:layout">pre-paginated</meta>\n'
+            '    <meta property="rendition:spread">none</meta>\n'
+            '  </metadata>\n'
+            '  <manifest>\n' + "\n".join(manifest) + '\n  </manifest>\n'
+            '  <spine page-progression-direction="rtl">\n' + "\n".join(spine) + '\n  </spine>\n'
+            '</package>\n'), compress_type=zipfile.ZIP_DEFLATED)
+
+        self._archive.writestr("OEBPS/nav.xhtml", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<!DOCTYPE html>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+            f'<head><title>{title}</title></head>\n'
+            '<body><nav epub:type="toc"><ol>'
+            f'<li><a href="{self._pages[0][1] if self._pages else "nav.xhtml"}">{title}</a></li>'
+            '</ol></nav></body>\n'
+            '</html>\n'), compress_type=zipfile.ZIP_DEFLATED)
+
+        self._archive.close()
+        with open(self._tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(self._tmp_path, self.path)
+        print(f"EPUB written: {self.path} ({len(self._pages)} pages)")
+
+    def abort(self):
+        self._archive.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+WRITERS = {"pdf": PdfWriter, "epub": EpubWriter}
+
+
+def _volume_title(metadata):
+    """Build a readable title like 'Kaiju No 8 - Volume 3' from metadata."""
+    parts = [metadata.get("series") or "Manga"]
+    if metadata.get("volume") is not None:
+        parts.append(f"Volume {metadata['volume']}")
+    elif metadata.get("number") is not None:
+        parts.append(f"Chapter {metadata['number']}")
+    return " - ".join(parts)
+
+
+def export_volume(source, output_format, output_dir=None, metadata=None):
+    """Convert one chapter/volume folder or CBZ into a PDF or EPUB file."""
+    name = os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+    output_dir = output_dir or os.path.dirname(os.path.abspath(source))
+    destination = os.path.join(output_dir, f"{name}.{output_format}")
+    metadata = dict(metadata or {})
+    metadata.setdefault("title", name)
+
+    writer = WRITERS[output_format](destination, metadata)
+    try:
+        for page_number, (_, data) in enumerate(iter_pages(source), 1):
+            writer.write_page(page_number, data)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return destination
+
+
+def export_volumes(sources, output_format, output_dir=None, workers=EXPORT_WORKERS):
+    """Export several volumes in parallel on a process pool."""
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(export_volume, source, output_format, output_dir): source
+            for source in sources
+        }
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Error exporting {source}: {e}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert downloaded chapter/volume folders or CBZs to PDF or EPUB.")
+    parser.add_argument("sources", nargs="+",
+                        help="chapter-NNN/volume-NNN folders or .cbz files")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="pdf")
+    parser.add_argument("--output", help="output directory (default: next to each source)")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    args = parser.parse_args()
+
+    export_volumes(args.sources, args.format, args.output, args.workers)
+
+
+if __name__ == "__main__":
+    main()
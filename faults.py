@@ -0,0 +1,349 @@
+import os
+import re
+import time
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from export import iter_pages
+from imaging import dhash, imaging_available, is_duplicate
+from main import (RUN_LOG_NAME, create_driver, download_chapter_supervised,
+                  quit_driver)
+from replay import isolated_state
+from watchdog import kill_driver
+
+STANDIN_PORT = int(os.getenv('STANDIN_PORT', '8791'))
+
+# Fault types the harness can inject, each at one page of a chapter.
+FAULTS = ("missing_image", "stalled_image", "slow_next", "mid_404", "browser_crash")
+
+SERIES_PATH = "/read/stand-in-1/en"
+
+READER_HTML = """<!DOCTYPE html>
+<html><head><title>Stand-in chapter {chapter}</title><style>
+body {{ margin: 0; background: #fff; font-family: sans-serif; }}
+.ds-item {{ display: none; }}
+.ds-item.active {{ display: block; }}
+.image-horizontal {{ width: 700px; height: 1000px; background-size: contain;
+                     background-repeat: no-repeat; }}
+</style></head><body>
+<div id="reader">
+<div class="read-tips"><div>Horizontal Follow</div></div>
+<div class="navi-buttons"><span><span class="hoz-total-image">{total}</span></span></div>
+<a class="nabu nabu-right hoz-prev" href="#" onclick="step(-1); return false;">Prev</a>
+<a class="nabu nabu-left hoz-next" href="#" onclick="step(1); return false;">Next</a>
+<div class="ds-list">{slides}</div>
+</div>
+<script>
+var slowFrom = {slow_from}, slowDelay = {slow_delay}, busy = false;
+function items() {{ return document.querySelectorAll('.ds-item'); }}
+function current() {{
+    var all = items();
+    for (var i = 0; i < all.length; i++) if (all[i].classList.contains('active')) return i;
+    return -1;
+}}
+function show(index) {{
+    var all = items();
+    if (index < 0 || index >= all.length) return;
+    for (var i = 0; i < all.length; i++) all[i].classList.toggle('active', i === index);
+}}
+function step(direction) {{
+    // Like the real reader, clicks during a page transition are ignored
+    if (busy) return;
+    var index = current();
+    if (direction > 0 && index === slowFrom) {{
+        busy = true;
+        slowFrom = -1;
+        setTimeout(function () {{ busy = false; show(index + 1); }}, slowDelay * 1000);
+        return;
+    }}
+    show(index + direction);
+}}
+function fromHash() {{
+    var match = location.hash.match(/^#page-(\\d+)$/);
+    show(match ? parseInt(match[1], 10) - 1 : 0);
+}}
+window.addEventListener('hashchange', fromHash);
+fromHash();
+</script></body></html>"""
+
+SLIDE_HTML = ('<div class="ds-item"><div class="image-horizontal" '
+              'style="background-image: url(/img/{chapter}/{page}.svg)"></div></div>')
+MISSING_SLIDE_HTML = '<div class="ds-item"><div class="loading-image"></div></div>'
+
+# Laid out so the "not found" message sits where main.NOT_FOUND_XPATH looks.
+NOT_FOUND_HTML = """<!DOCTYPE html>
+<html><head><title>404</title></head><body>
+<div></div><div></div>
+<div><div></div><div></div><div></div>
+<div><div><div><div></div><div>Sorry, the page you are looking for is not found.</div></div></div></div>
+</div></body></html>"""
+
+
+def page_image(page):
+    """Return an SVG page: a grid of grays unique to the page, and its number.
+
+    Every chapter has the same pages, so the clean baseline chapter is the
+    reference the faulty ones are scored against.
+    """
+    rng = random.Random(page)
+    cells = []
+    for row in range(20):
+        for column in range(14):
+            gray = rng.randint(30, 225)
+            cells.append(f'<rect x="{column * 50}" y="{row * 50}" width="50" height="50" '
+                         f'fill="rgb({gray},{gray},{gray})"/>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="700" height="1000">'
+            f'{"".join(cells)}<text x="350" y="540" font-size="160" text-anchor="middle" '
+            f'fill="#000">{page}</text></svg>').encode("utf-8")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serve stand-in reader pages and their images, injecting planned faults."""
+
+    def do_GET(self):
+        site = self.server
+        path = self.path.split("#")[0].split("?")[0]
+        match = re.fullmatch(rf"{SERIES_PATH}/chapter-(\d+)", path)
+        if match:
+            return self._chapter(int(match.group(1)))
+        match = re.fullmatch(r"/img/(\d+)/(\d+)\.svg", path)
+        if match:
+            chapter, page = int(match.group(1)), int(match.group(2))
+            plan = site.plans.get(chapter, {})
+            if plan.get("fault") == "stalled_image" and plan["page"] == page:
+                with site.lock:
+                    stall = not plan.get("stalled")
+                    plan["stalled"] = True
+                if stall:
+                    time.sleep(site.stall_seconds)
+            return self._send(200, page_image(page), "image/svg+xml")
+        self._send(404, NOT_FOUND_HTML.encode("utf-8"), "text/html")
+
+    def _chapter(self, chapter):
+        site = self.server
+        plan = site.plans.get(chapter, {})
+        with site.lock:
+            plan["loads"] = loads = plan.get("loads", 0) + 1
+        fault, fault_page = plan.get("fault"), plan.get("page")
+        if fault == "mid_404" and 1 < loads <= 1 + site.not_found_loads:
+            return self._send(200, NOT_FOUND_HTML.encode("utf-8"), "text/html")
+
+        slides = []
+        for page in range(1, site.pages + 1):
+            broken = (page == fault_page and loads == 1
+                      and fault in ("missing_image", "mid_404"))
+            slides.append(MISSING_SLIDE_HTML if broken
+                          else SLIDE_HTML.format(chapter=chapter, page=page))
+        html = READER_HTML.format(
+            chapter=chapter, slides="".join(slides),
+            # The real reader counts its closing slide too
+            total=site.pages + 1,
+            slow_from=fault_page - 1 if fault == "slow_next" else -1,
+            slow_delay=site.slow_next_seconds)
+        self._send(200, html.encode("utf-8"), "text/html")
+
+    def _send(self, status, body, content_type):
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInSite(ThreadingHTTPServer):
+    """A local copy of the reader's layout whose chapters fail on purpose."""
+
+    daemon_threads = True
+
+    def __init__(self, pages, port=STANDIN_PORT, stall_seconds=20.0,
+                 slow_next_seconds=8.0, not_found_loads=1):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.pages = pages
+        self.stall_seconds = stall_seconds
+        self.slow_next_seconds = slow_next_seconds
+        self.not_found_loads = not_found_loads
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def plan(self, chapter, fault, page):
+        """Inject `fault` at `page` of `chapter` (None for a clean chapter)."""
+        self.plans[chapter] = {"fault": fault, "page": page}
+
+    def chapter_url(self, chapter):
+        return f"http://127.0.0.1:{self.server_address[1]}{SERIES_PATH}/chapter-{chapter}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def saved_page_hashes(folder, chapter):
+    """Return {page number: perceptual hash} for a downloaded stand-in chapter."""
+    name = f"chapter-{chapter:03d}"
+    for source in (os.path.join(folder, name), os.path.join(folder, f"{name}.cbz")):
+        if os.path.exists(source):
+            break
+    else:
+        return {}
+    hashes = {}
+    for page_name, data in iter_pages(source):
+        stem = os.path.splitext(os.path.basename(page_name))[0]
+        if stem.isdigit():
+            hashes[int(stem)] = dhash(data) if imaging_available() else None
+    return hashes
+
+
+def run_case(site, fault, chapter, fault_page, width, height):
+    """Download one stand-in chapter with `fault` injected and measure it.
+
+    Every case starts from default timeouts and selector choices in a fresh
+    browser profile, so what one case teaches them can't help or hurt the
+    next.
+    """
+    site.plan(chapter, fault, fault_page)
+    browsers = {}
+
+    def new_driver():
+        browsers["driver"] = create_driver(width, height)
+        return browsers["driver"]
+
+    saved_at = {}
+
+    def on_page(page_number):
+        saved_at.setdefault(page_number, time.time())
+        if fault == "browser_crash" and page_number == fault_page - 1 and "crashed" not in browsers:
+            browsers["crashed"] = time.time()
+            kill_driver(browsers["driver"])
+
+    with tempfile.TemporaryDirectory() as folder, isolated_state():
+        started = time.time()
+        error = None
+        try:
+            success, _ = download_chapter_supervised(
+                new_driver(), new_driver, site.chapter_url(chapter), folder,
+                "chapter", chapter, on_page=on_page, tabs=1)
+        except Exception as e:
+            success, error = False, f"{e.__class__.__name__}: {e}"
+        finally:
+            quit_driver(browsers["driver"])
+        seconds = time.time() - started
+        hashes = saved_page_hashes(folder, chapter)
+        restarts = 0
+        log_path = os.path.join(folder, RUN_LOG_NAME)
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                restarts = sum("Restarting browser" in line for line in f)
+    return {"fault": fault or "none", "success": success, "error": error,
+            "seconds": seconds, "saved_at": saved_at, "hashes": hashes,
+            "restarts": restarts}
+
+
+def score(case, reference, page_interval, pages, fault_page):
+    """Add pages lost, wrong pages and time to recover to a case."""
+    correct = set()
+    wrong = []
+    for page, page_hash in case["hashes"].items():
+        expected = reference.get(page)
+        if expected is None or page_hash is None or is_duplicate(page_hash, expected):
+            correct.add(page)
+        else:
+            wrong.append(page)
+    case["lost"] = pages - len(correct)
+    case["wrong"] = sorted(wrong)
+    saved_at = case["saved_at"]
+    case["recovered"] = fault_page in correct
+    case["recovery"] = None
+    if case["recovered"] and fault_page - 1 in saved_at:
+        gap = saved_at[fault_page] - saved_at[fault_page - 1]
+        case["recovery"] = max(0.0, gap - page_interval)
+    return case
+
+
+def _print_results(cases):
+    print(f"{'fault':<15}{'runs':>5}{'recovered':>11}{'recover s':>11}"
+          f"{'pages lost':>12}{'wrong':>7}{'restarts':>10}{'total s':>9}")
+    for fault in ["none", *FAULTS]:
+        runs = [case for case in cases if case["fault"] == fault]
+        if not runs:
+            continue
+        recoveries = [case["recovery"] for case in runs if case["recovery"] is not None]
+        recovered = sum(case["recovered"] for case in runs)
+        print(f"{fault:<15}{len(runs):>5}{f'{recovered}/{len(runs)}':>11}"
+              f"{(f'{statistics.median(recoveries):.1f}' if recoveries else '-'):>11}"
+              f"{statistics.mean(case['lost'] for case in runs):>12.1f}"
+              f"{sum(len(case['wrong']) for case in runs):>7}"
+              f"{sum(case['restarts'] for case in runs):>10}"
+              f"{statistics.median(case['seconds'] for case in runs):>9.1f}")
+    for case in cases:
+        if case["error"]:
+            print(f"{case['fault']}: {case['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how the downloader recovers from injected site and browser faults.")
+    parser.add_argument("--faults", nargs="+", choices=FAULTS, default=list(FAULTS))
+    parser.add_argument("--pages", type=int, default=12, help="pages per stand-in chapter")
+    parser.add_argument("--fault-page", type=int, default=6, help="page the fault hits")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per fault type")
+    parser.add_argument("--stall-seconds", type=float, default=20.0,
+                        help="how long a stalled image hangs")
+    parser.add_argument("--slow-next-seconds", type=float, default=8.0,
+                        help="how long the slow Next takes to turn the page")
+    parser.add_argument("--not-found-loads", type=int, default=1,
+                        help="reloads answered with the 404 page after a mid-chapter break")
+    parser.add_argument("--port", type=int, default=STANDIN_PORT)
+    parser.add_argument("--width", type=int, default=1450)
+    parser.add_argument("--height", type=int, default=1934)
+    args = parser.parse_args()
+    if not 2 <= args.fault_page <= args.pages:
+        parser.error("--fault-page must be between 2 and --pages")
+
+    site = StandInSite(args.pages, args.port, args.stall_seconds,
+                       args.slow_next_seconds, args.not_found_loads).start()
+    print(f"Stand-in site on {site.chapter_url(1)}")
+    chapter = 0
+    cases = []
+    try:
+        # A clean chapter first, for the reference pages and normal page time
+        chapter += 1
+        baseline = run_case(site, None, chapter, args.fault_page, args.width, args.height)
+        reference = baseline["hashes"]
+        times = sorted(baseline["saved_at"].values())
+        page_interval = (statistics.median(b - a for a, b in zip(times, times[1:]))
+                         if len(times) > 1 else 0.0)
+        print(f"Baseline: {len(reference)}/{args.pages} pages, "
+              f"{page_interval:.1f}s per page")
+        cases.append(score(baseline, reference, page_interval, args.pages, args.fault_page))
+
+        for fault in args.faults:
+            for _ in range(args.repeat):
+                chapter += 1
+                print(f"Injecting {fault} at page {args.fault_page} of chapter {chapter}")
+                case = run_case(site, fault, chapter, args.fault_page, args.width, args.height)
+                cases.append(score(case, reference, page_interval, args.pages,
+                                   args.fault_page))
+    except KeyboardInterrupt:
+        print("Interrupted, results so far:")
+    finally:
+        site.shutdown()
+        site.server_close()
+    _print_results(cases)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+import io
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from export import iter_pages
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # Image checks are skipped when these aren't installed
+    np = None
+    Image = None
+
+# Trim solid borders and reader padding from captured pages. Off by default:
+# every page has to be decoded to find its borders, and re-encoded when some
+# are trimmed, which costs far more than the rest of the capture.
+AUTOCROP = os.getenv('AUTOCROP', '0') == '1'
+# Rows/columns whose brightness variance is at or below this count as border.
+CROP_VARIANCE_THRESHOLD = float(os.getenv('CROP_VARIANCE_THRESHOLD', '6.0'))
+# The bounding box is found on a copy shrunk by this factor, then scaled back.
+CROP_ANALYSIS_SCALE = int(os.getenv('CROP_ANALYSIS_SCALE', '4'))
+# Don't bother re-encoding when less than this many pixels would be trimmed.
+CROP_MIN_TRIM = int(os.getenv('CROP_MIN_TRIM', '4'))
+
+# Frame checks run on a copy about this many pixels wide.
+CHECK_WIDTH = 96
+# A frame whose brightness spread is below this is blank.
+BLANK_STD = float(os.getenv('BLANK_STD', '3.0'))
+# A frame where one brightness level covers this share of pixels is a
+# loading screen (a spinner or placeholder on a flat background).
+LOADING_DOMINANCE = float(os.getenv('LOADING_DOMINANCE', '0.97'))
+# A frame whose bottom is blank for this share of its height more than its
+# top is only partially painted.
+PARTIAL_FRACTION = float(os.getenv('PARTIAL_FRACTION', '0.3'))
+# Pages whose perceptual hashes differ in at most this many bits are the same.
+DUPLICATE_DISTANCE = int(os.getenv('DUPLICATE_DISTANCE', '3'))
+
+
+def imaging_available():
+    """Return True when NumPy and Pillow are installed."""
+    return np is not None
+
+
+def _open(data):
+    """Decode image bytes with Pillow."""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def _encode_like(image, original_format):
+    """Encode an image back to the format it was captured in."""
+    buffer = io.BytesIO()
+    if original_format == "JPEG":
+        image.convert("RGB").save(buffer, "JPEG", quality=92)
+    else:
+        # Pillow's default level: the fastest levels make a cropped page
+        # larger than the browser's uncropped screenshot.
+        image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def content_bbox(gray, threshold=CROP_VARIANCE_THRESHOLD):
+    """Return (top, bottom, left, right) of the non-uniform area of a 2D array.
+
+    Row and column variances are computed as mean of squares minus squared
+    mean, from row and column sums of the pixels and of their squares.
+    Returns None for a uniform image.
+    """
+    pixels = gray.astype(np.float32)
+    squares = pixels * pixels
+    height, width = pixels.shape
+    row_var = squares.sum(axis=1) / width - (pixels.sum(axis=1) / width) ** 2
+    col_var = squares.sum(axis=0) / height - (pixels.sum(axis=0) / height) ** 2
+
+    rows = np.flatnonzero(row_var > threshold)
+    cols = np.flatnonzero(col_var > threshold)
+    if rows.size == 0 or cols.size == 0:
+        return None
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+def autocrop(data):
+    """Trim letterbox borders from a captured page, returning new image bytes.
+
+    The page is returned unchanged when there is nothing worth trimming,
+    when it is blank (blank frames are handled by the capture checks), or
+    when the cropped page would not be a smaller file.
+    """
+    image = Image.open(io.BytesIO(data))
+    original_format = image.format
+    width, height = image.size
+    scale = max(1, CROP_ANALYSIS_SCALE)
+    # JPEG pages are decoded straight at (about) the analysis size; other
+    # formats are decoded in full and shrunk before the grayscale conversion.
+    image.draft("L", (max(1, width // scale), max(1, height // scale)))
+    drafted = image.size != (width, height)
+    remaining = max(1, round(scale * image.size[0] / width))
+    small = (image.reduce(remaining) if remaining > 1 else image).convert("L")
+    bbox = content_bbox(np.asarray(small))
+    if bbox is None:
+        return data
+
+    # Scale back up and widen by one analysis cell so no content is lost.
+    x_scale, y_scale = width / small.size[0], height / small.size[1]
+    top, bottom, left, right = bbox
+    top = max(0, int((top - 1) * y_scale))
+    left = max(0, int((left - 1) * x_scale))
+    bottom = min(height, int(np.ceil((bottom + 1) * y_scale)))
+    right = min(width, int(np.ceil((right + 1) * x_scale)))
+
+    trimmed = max(top, left, height - bottom, width - right)
+    if trimmed < CROP_MIN_TRIM:
+        return data
+    if drafted:
+        image = _open(data)
+    cropped = _encode_like(image.crop((left, top, right, bottom)), original_format)
+    return cropped if len(cropped) < len(data) else data
+
+
+def _check_copy(image):
+    """Return a ~96 px wide grayscale copy used by the frame checks."""
+    factor = max(1, image.size[0] // CHECK_WIDTH)
+    return (image.reduce(factor) if factor > 1 else image).convert("L")
+
+
+def _problem(small):
+    """Classify a small grayscale frame as 'blank', 'loading', 'partial' or None."""
+    pixels = np.asarray(small)
+    if pixels.std() < BLANK_STD:
+        return "blank"
+
+    histogram = np.bincount(pixels.ravel() // 8, minlength=32)
+    if histogram.max() / pixels.size >= LOADING_DOMINANCE:
+        return "loading"
+
+    # Rows that are flat all the way across, counted in from each edge.
+    flat_rows = pixels.std(axis=1) < BLANK_STD
+    height = flat_rows.size
+    content_rows = np.flatnonzero(~flat_rows)
+    if content_rows.size == 0:
+        # Horizontal bands or a vertical gradient: no row has detail, but the
+        # frame as a whole does, so there is no blank bottom to speak of.
+        return None
+    leading = content_rows[0]
+    trailing = height - 1 - content_rows[-1]
+    if (trailing - leading) / height >= PARTIAL_FRACTION:
+        return "partial"
+    return None
+
+
+def _dhash(small):
+    """64-bit difference hash: is each pixel brighter than its left neighbour."""
+    pixels = np.asarray(small.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def inspect_frame(data):
+    """Return (problem, perceptual hash) for a capture from a single decode."""
+    small = _check_copy(_open(data))
+    return _problem(small), _dhash(small)
+
+
+def dhash(data):
+    """Return the perceptual hash of an image."""
+    return _dhash(_check_copy(_open(data)))
+
+
+def hamming(first, second):
+    """Number of differing bits between two hashes."""
+    return bin(first ^ second).count("1")
+
+
+def is_duplicate(first, second, max_distance=DUPLICATE_DISTANCE):
+    """Return True when two page hashes are close enough to be the same page."""
+    return (first is not None and second is not None
+            and hamming(first, second) <= max_distance)
+
+
+def find_duplicate_pages(source, max_distance=DUPLICATE_DISTANCE):
+    """Return (page, previous page, distance) for back-to-back repeats in a chapter.
+
+    A page that matches the one before it usually means a 'Next' click was
+    missed and the same page was saved twice.
+    """
+    duplicates = []
+    previous_name = previous_hash = None
+    for name, data in iter_pages(source):
+        page_hash = dhash(data)
+        if is_duplicate(page_hash, previous_hash, max_distance):
+            duplicates.append((name, previous_name, hamming(page_hash, previous_hash)))
+        previous_name, previous_hash = name, page_hash
+    return duplicates
+
+
+if __name__ == "__main__":
+    import sys
+
+    for chapter in sys.argv[1:]:
+        for name, previous_name, distance in find_duplicate_pages(chapter):
+            print(f"{chapter}: {name} repeats {previous_name} (distance {distance})")
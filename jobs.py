@@ -0,0 +1,711 @@
+import os
+import math
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from main import (CHAPTER_TABS, create_driver, get_endpoint_pool,
+                  download_chapter_supervised, extract_url_info, generate_next_url,
+                  get_total_pages, log_run_event, navigate_and_prepare,
+                  discard_driver, quit_driver)
+from pool import DriverPool
+from sinks import ChapterStopped
+from strategies import get_registry
+from timeouts import get_tuner
+
+# Queue of series and chapters to download, kept on disk so a crashed or
+# interrupted run picks up where it stopped.
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH') or os.path.join(
+    os.path.expanduser("~"), ".manga_dl", "jobs.sqlite3")
+# A chapter that fails this many times is marked failed and its series stops.
+MAX_CHAPTER_ATTEMPTS = int(os.getenv('MAX_CHAPTER_ATTEMPTS', '3'))
+# Seconds to wait before retrying a failed chapter.
+RETRY_DELAY = float(os.getenv('RETRY_DELAY', '300'))
+# Browsers downloading chapters from the queue at the same time.
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '1'))
+# Seconds an idle worker waits before looking at the queue again.
+SCHEDULER_POLL = float(os.getenv('SCHEDULER_POLL', '10'))
+# A worker holds a lease on each chapter it downloads and renews it every
+# HEARTBEAT_INTERVAL seconds. A chapter whose lease ran out because its
+# worker died or lost the connection is handed to another worker.
+LEASE_SECONDS = float(os.getenv('LEASE_SECONDS', '120'))
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', '30'))
+# Hand out the longest chapters first within each priority, so one huge
+# volume isn't left for last while the other workers sit idle. Set to 0 to
+# download in series and chapter order.
+LONGEST_FIRST = os.getenv('LONGEST_FIRST', '1') == '1'
+# Cost guesses for chapters nobody has counted or timed yet.
+DEFAULT_CHAPTER_PAGES = int(os.getenv('DEFAULT_CHAPTER_PAGES', '40'))
+DEFAULT_PAGE_SECONDS = float(os.getenv('DEFAULT_PAGE_SECONDS', '3'))
+# Chapters with more pages than this are split across extra browser tabs,
+# one per SPLIT_PAGES pages, up to MAX_SPLIT_TABS.
+SPLIT_PAGES = int(os.getenv('SPLIT_PAGES', '100'))
+MAX_SPLIT_TABS = int(os.getenv('MAX_SPLIT_TABS', '4'))
+
+# Chapter states. A chapter moves queued -> running -> done, missing (the
+# reader had no such chapter, so the series is caught up) or failed. A
+# running chapter whose lease expired can be claimed again.
+QUEUED, RUNNING, DONE, MISSING, FAILED = "queued", "running", "done", "missing", "failed"
+# Series states. A series with a last chapter is done once all of its
+# chapters are; failed also applies to series.
+ACTIVE, CAUGHT_UP = "active", "caught_up"
+
+
+class JobStore:
+    """Series, chapters and saved pages in a SQLite database.
+
+    Every state change is a single transaction, so the queue is consistent
+    whenever the process dies. Workers on other machines reach it through
+    worker.py's queue server.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS series (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                base_url TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                paused INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'active',
+                last_number INTEGER,
+                added REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chapters (
+                id INTEGER PRIMARY KEY,
+                series_id INTEGER NOT NULL REFERENCES series (id) ON DELETE CASCADE,
+                number INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                not_before REAL NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                page_count INTEGER,
+                pages INTEGER,
+                started REAL,
+                finished REAL,
+                seconds REAL,
+                error TEXT,
+                UNIQUE (series_id, number)
+            );
+            CREATE INDEX IF NOT EXISTS chapters_state ON chapters (state, not_before);
+            CREATE TABLE IF NOT EXISTS pages (
+                chapter_id INTEGER NOT NULL REFERENCES chapters (id) ON DELETE CASCADE,
+                page_number INTEGER NOT NULL,
+                saved REAL NOT NULL,
+                PRIMARY KEY (chapter_id, page_number)
+            );
+            CREATE TABLE IF NOT EXISTS watch (
+                series_id INTEGER PRIMARY KEY REFERENCES series (id) ON DELETE CASCADE,
+                listing_url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                listing_hash TEXT,
+                latest_number INTEGER,
+                interval REAL NOT NULL,
+                next_poll REAL NOT NULL DEFAULT 0,
+                last_polled REAL,
+                last_new REAL
+            );
+            CREATE INDEX IF NOT EXISTS watch_next_poll ON watch (next_poll);
+        """)
+        # Columns added since the first version of the database
+        for table, column, kind in (("chapters", "lease_expires", "REAL"),
+                                    ("chapters", "page_count", "INTEGER"),
+                                    ("series", "last_number", "INTEGER")):
+            columns = [row["name"] for row in self._db.execute(f"PRAGMA table_info({table})")]
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+    @contextmanager
+    def _transaction(self):
+        """Run the block as one write transaction, rolled back on error."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def add_series(self, url, folder, priority=0, last_number=None):
+        """Queue a series starting at the chapter or volume `url`.
+
+        With `last_number` the whole range is queued at once, so its
+        chapters can be downloaded in parallel, and the series ends there.
+        """
+        content_type, number, base_url = extract_url_info(url)
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT INTO series (url, base_url, content_type, folder, priority, "
+                "last_number, added) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, base_url, content_type, os.path.abspath(folder), priority,
+                 last_number, time.time()))
+            db.execute("INSERT INTO chapters (series_id, number, url) VALUES (?, ?, ?)",
+                       (cursor.lastrowid, number, url))
+            for later in range(number + 1, (last_number or number) + 1):
+                db.execute("INSERT INTO chapters (series_id, number, url) VALUES (?, ?, ?)",
+                           (cursor.lastrowid, later,
+                            generate_next_url(base_url, content_type, later - 1)))
+            return cursor.lastrowid
+
+    def set_priority(self, series_id, priority):
+        with self._transaction() as db:
+            db.execute("UPDATE series SET priority = ? WHERE id = ?", (priority, series_id))
+
+    def pause(self, series_id):
+        """Stop handing out chapters of a series; a running one finishes."""
+        with self._transaction() as db:
+            db.execute("UPDATE series SET paused = 1 WHERE id = ?", (series_id,))
+
+    def resume(self, series_id):
+        with self._transaction() as db:
+            db.execute("UPDATE series SET paused = 0 WHERE id = ?", (series_id,))
+
+    def retry(self, series_id):
+        """Queue a series' failed chapters again with a fresh attempt count."""
+        with self._transaction() as db:
+            db.execute("UPDATE chapters SET state = ?, attempts = 0, not_before = 0, "
+                       "error = NULL WHERE series_id = ? AND state = ?",
+                       (QUEUED, series_id, FAILED))
+            db.execute("UPDATE series SET state = ? WHERE id = ?", (ACTIVE, series_id))
+
+    def _history(self, db):
+        """Return per-series and overall (pages per chapter, seconds per page)."""
+        rows = db.execute("""
+            SELECT series_id, AVG(pages), SUM(seconds), SUM(pages) FROM chapters
+            WHERE state = 'done' AND pages > 0 AND seconds > 0 GROUP BY series_id
+        """).fetchall()
+        history = {row[0]: (row[1], row[2] / row[3]) for row in rows}
+        total_pages = sum(row[3] for row in rows)
+        overall = (
+            sum(row[1] for row in rows) / len(rows) if rows else DEFAULT_CHAPTER_PAGES,
+            sum(row[2] for row in rows) / total_pages if total_pages else DEFAULT_PAGE_SECONDS)
+        return history, overall
+
+    def _estimate(self, row, history, overall):
+        """Return (expected pages, expected seconds) for a chapter row."""
+        chapter_pages, page_seconds = history.get(row["series_id"], overall)
+        pages = row["page_count"] or chapter_pages
+        return pages, pages * page_seconds
+
+    def claim(self, worker):
+        """Lease the next chapter to download to `worker` and return it.
+
+        Chapters of higher-priority series go first. Within a priority the
+        chapter expected to take longest goes first (see LONGEST_FIRST),
+        judged by its page count and how long pages of that series took so
+        far. Chapters whose lease expired are claimable again. Returns None
+        when nothing is ready.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            # A worker only claims when it holds nothing, so a chapter still
+            # leased to it is left over from a call whose answer never arrived.
+            db.execute("UPDATE chapters SET state = ?, worker = NULL, lease_expires = NULL, "
+                       "attempts = attempts - 1 WHERE worker = ? AND state = ?",
+                       (QUEUED, worker, RUNNING))
+            rows = db.execute("""
+                SELECT c.id, c.series_id, c.number, c.url, c.attempts, c.worker,
+                       c.page_count, s.priority, s.base_url, s.content_type, s.folder
+                FROM chapters c JOIN series s ON s.id = c.series_id
+                WHERE s.paused = 0 AND ((c.state = ? AND c.not_before <= ?)
+                                        OR (c.state = ? AND COALESCE(c.lease_expires, 0) < ?))
+                    AND s.priority = (
+                        SELECT MAX(s2.priority) FROM chapters c2
+                        JOIN series s2 ON s2.id = c2.series_id
+                        WHERE s2.paused = 0 AND ((c2.state = ? AND c2.not_before <= ?)
+                            OR (c2.state = ? AND COALESCE(c2.lease_expires, 0) < ?)))
+                ORDER BY s.id, c.number
+            """, (QUEUED, now, RUNNING, now) * 2).fetchall()
+            if not rows:
+                return None
+            history, overall = self._history(db)
+            row = rows[0]
+            if LONGEST_FIRST:
+                row = max(rows, key=lambda row: self._estimate(row, history, overall)[1])
+            pages, seconds = self._estimate(row, history, overall)
+            db.execute("UPDATE chapters SET state = ?, worker = ?, lease_expires = ?, "
+                       "attempts = attempts + 1, started = ?, finished = NULL, error = NULL "
+                       "WHERE id = ?",
+                       (RUNNING, worker, now + LEASE_SECONDS, now, row["id"]))
+        job = dict(row)
+        job["expired_worker"] = job.pop("worker")
+        job["worker"] = worker
+        job["estimated_seconds"] = seconds
+        job["tabs"] = CHAPTER_TABS
+        if row["page_count"] and row["page_count"] > SPLIT_PAGES:
+            job["tabs"] = max(CHAPTER_TABS, min(MAX_SPLIT_TABS,
+                                                math.ceil(row["page_count"] / SPLIT_PAGES)))
+        return job
+
+    def heartbeat(self, worker):
+        """Renew the leases `worker` holds and return how many it still has."""
+        with self._transaction() as db:
+            return db.execute("UPDATE chapters SET lease_expires = ? "
+                              "WHERE worker = ? AND state = ?",
+                              (time.time() + LEASE_SECONDS, worker, RUNNING)).rowcount
+
+    def record_page(self, chapter_id, page_number):
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                       (chapter_id, page_number, time.time()))
+
+    def saved_pages(self, chapter_id):
+        return [row[0] for row in self._query(
+            "SELECT page_number FROM pages WHERE chapter_id = ? ORDER BY page_number",
+            (chapter_id,))]
+
+    def _holds_lease(self, db, job):
+        row = db.execute("SELECT state, worker FROM chapters WHERE id = ?",
+                         (job["id"],)).fetchone()
+        return row is not None and row["state"] == RUNNING and row["worker"] == job["worker"]
+
+    def finish(self, job, success, pages):
+        """Record a finished chapter and queue the next one.
+
+        An unsuccessful finish means the reader has no such chapter yet, so
+        the series is marked caught up. Returns False, changing nothing, if
+        the worker's lease had already been taken over.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            if not self._holds_lease(db, job):
+                return False
+            db.execute("UPDATE chapters SET state = ?, worker = NULL, lease_expires = NULL, "
+                       "pages = ?, page_count = COALESCE(?, page_count), finished = ?, "
+                       "seconds = ? - started WHERE id = ?",
+                       (DONE if success else MISSING, pages, pages if success else None,
+                        now, now, job["id"]))
+            last_number = db.execute("SELECT last_number FROM series WHERE id = ?",
+                                     (job["series_id"],)).fetchone()[0]
+            if not success:
+                db.execute("UPDATE series SET state = ? WHERE id = ?",
+                           (CAUGHT_UP, job["series_id"]))
+            elif last_number is None or job["number"] < last_number:
+                next_url = generate_next_url(job["base_url"], job["content_type"],
+                                             job["number"])
+                db.execute("INSERT OR IGNORE INTO chapters (series_id, number, url) "
+                           "VALUES (?, ?, ?)", (job["series_id"], job["number"] + 1, next_url))
+            if last_number is not None and not db.execute(
+                    "SELECT 1 FROM chapters WHERE series_id = ? AND state IN (?, ?)",
+                    (job["series_id"], QUEUED, RUNNING)).fetchone():
+                db.execute("UPDATE series SET state = ? WHERE id = ? AND state = ?",
+                           (DONE, job["series_id"], ACTIVE))
+        return True
+
+    def fail(self, job, error):
+        """Record a failed attempt, scheduling a retry while attempts remain."""
+        now = time.time()
+        with self._transaction() as db:
+            if not self._holds_lease(db, job):
+                return False
+            attempts = db.execute("SELECT attempts FROM chapters WHERE id = ?",
+                                  (job["id"],)).fetchone()[0]
+            if attempts < MAX_CHAPTER_ATTEMPTS:
+                db.execute("UPDATE chapters SET state = ?, worker = NULL, lease_expires = NULL, "
+                           "not_before = ?, finished = ?, seconds = ? - started, error = ? "
+                           "WHERE id = ?",
+                           (QUEUED, now + RETRY_DELAY, now, now, error, job["id"]))
+            else:
+                db.execute("UPDATE chapters SET state = ?, worker = NULL, lease_expires = NULL, "
+                           "finished = ?, seconds = ? - started, error = ? WHERE id = ?",
+                           (FAILED, now, now, error, job["id"]))
+                db.execute("UPDATE series SET state = ? WHERE id = ?",
+                           (FAILED, job["series_id"]))
+        return True
+
+    def uncounted(self):
+        """Return queued chapters whose page count isn't known yet."""
+        return [dict(row) for row in self._query(
+            "SELECT id, url FROM chapters WHERE state = ? AND page_count IS NULL "
+            "ORDER BY series_id, number", (QUEUED,))]
+
+    def set_page_count(self, chapter_id, page_count):
+        with self._transaction() as db:
+            db.execute("UPDATE chapters SET page_count = ? WHERE id = ?",
+                       (page_count, chapter_id))
+
+    def estimate(self):
+        """Return (chapters, expected seconds) for everything still queued."""
+        with self._lock:
+            history, overall = self._history(self._db)
+            rows = self._db.execute(
+                "SELECT series_id, page_count FROM chapters WHERE state IN (?, ?)",
+                (QUEUED, RUNNING)).fetchall()
+            return len(rows), sum(self._estimate(row, history, overall)[1] for row in rows)
+
+    def follow(self, series_id, listing_url, interval):
+        """Start watching a series' chapter listing for new releases."""
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO watch (series_id, listing_url, interval) "
+                       "VALUES (?, ?, ?)", (series_id, listing_url, interval))
+
+    def unfollow(self, series_id):
+        with self._transaction() as db:
+            db.execute("DELETE FROM watch WHERE series_id = ?", (series_id,))
+
+    def due_watches(self, now=None):
+        """Return followed series whose listing is due for a poll."""
+        return [dict(row) for row in self._query("""
+            SELECT w.*, s.base_url, s.content_type,
+                   (SELECT MAX(number) FROM chapters c
+                    WHERE c.series_id = w.series_id AND c.state != 'missing') AS known_number
+            FROM watch w JOIN series s ON s.id = w.series_id
+            WHERE w.next_poll <= ? ORDER BY w.next_poll
+        """, (time.time() if now is None else now,))]
+
+    def next_watch_poll(self):
+        """Return when the next followed series is due, or None."""
+        return self._query("SELECT MIN(next_poll) FROM watch")[0][0]
+
+    def record_poll(self, series_id, interval, etag=None, last_modified=None,
+                    listing_hash=None, latest_number=None):
+        """Save a poll's validators and schedule the next one.
+
+        Validators and the latest number are kept when a poll didn't
+        return new ones (for example on 304 Not Modified).
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("""
+                UPDATE watch SET interval = ?, next_poll = ?, last_polled = ?,
+                    etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),
+                    listing_hash = COALESCE(?, listing_hash),
+                    latest_number = COALESCE(?, latest_number)
+                WHERE series_id = ?
+            """, (interval, now + interval, now, etag, last_modified, listing_hash,
+                  latest_number, series_id))
+
+    def queue_new_chapters(self, series_id, numbers):
+        """Queue released chapters the series doesn't have yet.
+
+        Chapters that were missing when last tried are queued again. The
+        series is capped at the newest release, so downloading it doesn't
+        probe for a chapter that isn't out. Returns the numbers queued.
+        """
+        queued = []
+        with self._transaction() as db:
+            series = db.execute("SELECT base_url, content_type FROM series WHERE id = ?",
+                                (series_id,)).fetchone()
+            for number in sorted(numbers):
+                url = generate_next_url(series["base_url"], series["content_type"], number - 1)
+                changed = db.execute(
+                    "INSERT OR IGNORE INTO chapters (series_id, number, url) VALUES (?, ?, ?)",
+                    (series_id, number, url)).rowcount
+                changed = changed or db.execute(
+                    "UPDATE chapters SET state = ?, attempts = 0, not_before = 0, error = NULL "
+                    "WHERE series_id = ? AND number = ? AND state = ?",
+                    (QUEUED, series_id, number, MISSING)).rowcount
+                if changed:
+                    queued.append(number)
+            if queued:
+                db.execute("UPDATE series SET state = ?, last_number = ? WHERE id = ?",
+                           (ACTIVE, max(numbers), series_id))
+                db.execute("UPDATE watch SET last_new = ? WHERE series_id = ?",
+                           (time.time(), series_id))
+        return queued
+
+    def pending(self):
+        """Return how many chapters of unpaused series are queued or running."""
+        return self._query("""
+            SELECT COUNT(*) FROM chapters c JOIN series s ON s.id = c.series_id
+            WHERE c.state IN (?, ?) AND s.paused = 0
+        """, (QUEUED, RUNNING))[0][0]
+
+    def series(self):
+        """Return every series with its chapter counts and timings."""
+        return [dict(row) for row in self._query("""
+            SELECT s.id, s.url, s.content_type, s.priority, s.paused, s.state,
+                   SUM(c.state = 'done') AS done,
+                   SUM(c.state = 'failed') AS failed,
+                   MIN(CASE WHEN c.state IN ('queued', 'running') THEN c.number END) AS next,
+                   COALESCE(SUM(c.pages), 0) AS pages,
+                   COALESCE(SUM(CASE WHEN c.state = 'done' THEN c.seconds END), 0) AS seconds
+            FROM series s LEFT JOIN chapters c ON c.series_id = s.id
+            GROUP BY s.id ORDER BY s.priority DESC, s.id
+        """)]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class LeaseLost(ChapterStopped):
+    """Raised when another worker has taken over the chapter being downloaded."""
+
+
+class Scheduler:
+    """Download queued chapters from many series with a few browsers.
+
+    Each worker owns a DriverPool and repeatedly claims the next chapter.
+    Pausing a series or changing its priority takes effect at the next
+    claim, so it can be done from another process while this one runs.
+    `store` is a JobStore or, on other machines, a worker.RemoteJobStore.
+    """
+
+    def __init__(self, store, width, height, workers=SCHEDULER_WORKERS,
+                 poll_interval=SCHEDULER_POLL):
+        self.store = store
+        self.width = width
+        self.height = height
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self.node = f"{socket.gethostname()}/{os.getpid()}"
+        # Chapter each worker slot is downloading, and chapters whose lease
+        # the heartbeat found lost.
+        self._running = {}
+        self._lost = set()
+
+    def run(self, until_idle=True):
+        """Work through the queue, returning once it is empty if `until_idle`."""
+        threads = [threading.Thread(target=self._work, args=(slot, until_idle),
+                                    name=f"worker-{slot}", daemon=True)
+                   for slot in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+        finally:
+            self.stopping.set()
+        get_registry().report()
+        get_tuner().report()
+        endpoints = get_endpoint_pool()
+        if endpoints is not None:
+            endpoints.report()
+
+    def _heartbeat(self):
+        """Renew this node's leases until the scheduler stops."""
+        while not self.stopping.wait(HEARTBEAT_INTERVAL):
+            for slot in range(self.workers):
+                # Read before renewing, so a chapter claimed meanwhile isn't
+                # mistaken for a lost one.
+                running = self._running.get(slot)
+                try:
+                    held = self.store.heartbeat(f"{self.node}-{slot}")
+                except Exception as e:
+                    print(f"Heartbeat failed, leases may expire: {e}")
+                    continue
+                if running is not None and not held and self._running.get(slot) == running:
+                    self._lost.add(running)
+
+    def _check_lease(self, job_id):
+        """Stop the chapter before its next page if the heartbeat lost its lease."""
+        if job_id in self._lost:
+            raise LeaseLost(f"lease on chapter {job_id} expired and may belong "
+                            f"to another worker")
+
+    def stop(self):
+        """Let running chapters finish, then stop claiming new ones."""
+        self.stopping.set()
+
+    def _work(self, slot, until_idle):
+        worker = f"{self.node}-{slot}"
+        folder = [None]  # Series folder that pool events are logged to
+
+        def new_driver():
+            return create_driver(self.width, self.height, slot)
+
+        pool = DriverPool(new_driver, quit_driver, warm=navigate_and_prepare,
+                          log=lambda message: log_run_event(folder[0], message))
+        driver = None
+        try:
+            while not self.stopping.is_set():
+                try:
+                    job = self.store.claim(worker)
+                except Exception as e:
+                    print(f"Could not claim a chapter: {e}")
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                if job is None:
+                    try:
+                        pending = self.store.pending()
+                    except Exception as e:
+                        print(f"Could not count pending chapters: {e}")
+                        pending = True
+                    if until_idle and not pending:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+
+                folder[0] = job["folder"]
+                self._running[slot] = job["id"]
+                if job["expired_worker"]:
+                    log_run_event(job["folder"], f"Taking over {job['content_type']} "
+                                                 f"{job['number']} from {job['expired_worker']}, "
+                                                 f"whose lease expired")
+                pool.set_warm_url(job["url"])
+                if driver is None:
+                    driver = pool.acquire()
+                print(f"Processing {job['content_type']} {job['number']}: {job['url']} "
+                      f"(about {job.get('estimated_seconds', 0) / 60:.0f} min)")
+                try:
+                    success, driver = download_chapter_supervised(
+                        driver, pool.replace, job["url"], job["folder"],
+                        job["content_type"], job["number"],
+                        saved_pages=self.store.saved_pages(job["id"]),
+                        on_page=lambda page_number, job_id=job["id"]:
+                            self.store.record_page(job_id, page_number),
+                        tabs=job.get("tabs", CHAPTER_TABS),
+                        before_page=lambda page_number, job_id=job["id"]:
+                            self._check_lease(job_id))
+                except Exception as e:
+                    print(f"Error occurred at {job['content_type']} {job['number']}: {e}")
+                    try:
+                        if not self.store.fail(job, f"{e.__class__.__name__}: {e}"):
+                            print(f"Lease on {job['content_type']} {job['number']} was lost")
+                    except Exception as error:
+                        # The lease runs out and the chapter is retried then
+                        print(f"Could not record the failure of {job['content_type']} "
+                              f"{job['number']}: {error}")
+                        self.stopping.wait(self.poll_interval)
+                    discard_driver(driver)
+                    driver = pool.replace()
+                    continue
+                finally:
+                    self._running.pop(slot, None)
+                    self._lost.discard(job["id"])
+                pages = getattr(driver, "pages_captured", 0)
+                try:
+                    if not self.store.finish(job, success, pages):
+                        print(f"Lease on {job['content_type']} {job['number']} was lost, "
+                              f"another worker has taken it over")
+                except Exception as e:
+                    # The lease runs out and the chapter is resumed from its saved pages
+                    print(f"Could not record {job['content_type']} {job['number']} "
+                          f"as finished: {e}")
+                    self.stopping.wait(self.poll_interval)
+                driver = pool.checkin(driver, pages)
+        finally:
+            if driver is not None:
+                quit_driver(driver)
+            pool.report()
+            pool.close()
+
+
+def preflight(store, width, height):
+    """Count the pages of queued chapters so their cost is known up front.
+
+    Chapters that don't exist yet are left alone; the scheduler finds out
+    when it gets to them.
+    """
+    chapters = store.uncounted()
+    if not chapters:
+        return
+    driver = create_driver(width, height)
+    try:
+        for chapter in chapters:
+            try:
+                if not navigate_and_prepare(driver, chapter["url"]):
+                    continue
+                # Pages 1 to total - 1 are captured, matching download_chapter()
+                page_count = get_total_pages(driver) - 1
+            except Exception as e:
+                print(f"Could not count pages of {chapter['url']}: {e}")
+                continue
+            store.set_page_count(chapter["id"], page_count)
+    finally:
+        quit_driver(driver)
+
+
+def _print_series(store):
+    for series in store.series():
+        state = "paused" if series["paused"] else series["state"]
+        next_chapter = f", next {series['next']}" if series["next"] is not None else ""
+        print(f"[{series['id']}] {series['url']}\n"
+              f"    {state}, priority {series['priority']}, "
+              f"{series['done'] or 0} {series['content_type']}s done{next_chapter}, "
+              f"{series['failed'] or 0} failed, {series['pages']} pages "
+              f"in {series['seconds'] / 60:.1f} min")
+    chapters, seconds = store.estimate()
+    if chapters:
+        print(f"{chapters} chapters left, about {seconds / 60:.0f} min of browser time")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Queue series and download them with a persistent scheduler.")
+    parser.add_argument("--db", default=JOBS_DB_PATH, help="job database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="queue a series from its first chapter URL")
+    add.add_argument("url")
+    add.add_argument("folder")
+    add.add_argument("--priority", type=int, default=0)
+    add.add_argument("--to", type=int, dest="last_number",
+                     help="queue every chapter up to this number at once and stop there")
+
+    for name in ("pause", "resume", "retry"):
+        command = commands.add_parser(name, help=f"{name} a series")
+        command.add_argument("series_id", type=int)
+
+    priority = commands.add_parser("priority", help="change a series' priority")
+    priority.add_argument("series_id", type=int)
+    priority.add_argument("priority", type=int)
+
+    commands.add_parser("list", help="show queued series")
+
+    count = commands.add_parser("preflight", help="count pages of queued chapters")
+    count.add_argument("--width", type=int, default=1450)
+    count.add_argument("--height", type=int, default=1934)
+
+    run = commands.add_parser("run", help="download queued chapters")
+    run.add_argument("--workers", type=int, default=SCHEDULER_WORKERS)
+    run.add_argument("--width", type=int, default=1450)
+    run.add_argument("--height", type=int, default=1934)
+    run.add_argument("--wait", action="store_true",
+                     help="keep polling for new chapters instead of exiting when idle")
+    args = parser.parse_args()
+
+    store = JobStore(args.db)
+    if args.command == "add":
+        series_id = store.add_series(args.url, args.folder, args.priority, args.last_number)
+        print(f"Added series {series_id}")
+    elif args.command == "pause":
+        store.pause(args.series_id)
+    elif args.command == "resume":
+        store.resume(args.series_id)
+    elif args.command == "retry":
+        store.retry(args.series_id)
+    elif args.command == "priority":
+        store.set_priority(args.series_id, args.priority)
+    elif args.command == "list":
+        _print_series(store)
+    elif args.command == "preflight":
+        preflight(store, args.width, args.height)
+        _print_series(store)
+    else:
+        Scheduler(store, args.width, args.height, args.workers).run(until_idle=not args.wait)
+        _print_series(store)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,202 @@
 import os
 import time
+import functools
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.remote_connection import ChromeRemoteConnection
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
+from urllib3.exceptions import MaxRetryError, ProtocolError
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 
-# Load environment variables from the .env file
+# Load environment variables from the .env file before the modules below
+# read their settings
 load_dotenv()
 
+from pool import DriverPool
+from profiles import acquire_profile
+from remote import get_endpoint_pool
+from strategies import forget_layout, get_registry, layout_fingerprint
+from timeouts import get_tuner
+from events import context, emit
+from tracing import mark, record, span, traced
+from sinks import (ChapterStopped, ManifestSink, ProgressSink, ReorderSink, note_source,
+                   open_sink, set_page_count)
+from watchdog import (CAPTURE_DEADLINE, CHAPTER_DEADLINE, NAVIGATION_DEADLINE,
+                      PAGE_DEADLINE, Watchdog, WatchdogTimeout, deadline,
+                      kill_driver)
+from watchdog import check as check_watchdog
+from imaging import (dhash, imaging_available, inspect_frame, is_duplicate,
+                     hamming)
+
 # Constants
+# Optional: the uBlock .crx is only loaded when this is set.
 ADBLOCK_PATH = os.getenv('ADBLOCK_PATH')
-if not ADBLOCK_PATH:
-    raise ValueError(
-        "Environment variable 'ADBLOCK_PATH' is not set or empty.")
+BLOCKLIST_PATH = os.getenv('BLOCKLIST_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "blocklist.txt")
+
+# Stop and wait for Enter when a page can't be captured. Leave off for
+# unattended runs, where the supervisor restarts the browser instead.
+PAUSE_ON_FAILURE = os.getenv('PAUSE_ON_FAILURE', '0') == '1'
+# How many times a chapter may restart its browser before giving up.
+MAX_CHAPTER_RESTARTS = int(os.getenv('MAX_CHAPTER_RESTARTS', '3'))
+# Restarts and their causes are appended to this file in the download folder.
+RUN_LOG_NAME = "run.log"
+# Errors that mean the browser is gone or hung and should be restarted. A
+# crashed chromedriver often surfaces as a failed HTTP connection to it
+# rather than as a WebDriver error.
+BROWSER_FAILURES = (WatchdogTimeout, WebDriverException, MaxRetryError, ProtocolError)
+
+# Seconds to let a page paint before the first screenshot, and how often to
+# re-shoot a frame that looks blank, like a spinner or half painted.
+CAPTURE_SETTLE = float(os.getenv('CAPTURE_SETTLE', '1.0'))
+CAPTURE_RETRY_DELAY = float(os.getenv('CAPTURE_RETRY_DELAY', '0.5'))
+CAPTURE_RETRIES = int(os.getenv('CAPTURE_RETRIES', '6'))
+
+# How many times to click Next again when the reader doesn't move on. How
+# long to wait each time is tuned by timeouts.py.
+NEXT_CLICK_RETRIES = int(os.getenv('NEXT_CLICK_RETRIES', '3'))
+
+# Split long chapters into page ranges captured by this many browser windows
+# at once, but only when every window gets at least MIN_PAGES_PER_TAB pages.
+CHAPTER_TABS = int(os.getenv('CHAPTER_TABS', '1'))
+MIN_PAGES_PER_TAB = int(os.getenv('MIN_PAGES_PER_TAB', '20'))
+
+# Index of the active slide among the reader's pages, or -1.
+ACTIVE_INDEX_JS = """
+var items = document.querySelectorAll('.ds-item');
+for (var i = 0; i < items.length; i++) {
+    if (items[i].classList.contains('active')) {
+        return i;
+    }
+}
+return -1;
+"""
+
+# The image a page container shows: an <img>, a CSS background or a data
+# attribute. Canvas-drawn pages have none and are compared by hash instead.
+IMAGE_SOURCE_JS = """
+function source(el) {
+    if (!el) return null;
+    var img = el.tagName === 'IMG' ? el : el.querySelector('img');
+    if (img) return img.currentSrc || img.src || img.getAttribute('data-src');
+    var bg = getComputedStyle(el).backgroundImage;
+    if (bg && bg !== 'none') return bg.replace(/^url\\(["']?/, '').replace(/["']?\\)$/, '');
+    return el.getAttribute('data-url') || el.getAttribute('data-src');
+}
+"""
+IMAGE_SOURCE_OF_ELEMENT_JS = IMAGE_SOURCE_JS + "return source(arguments[0]);"
+PAGE_SOURCES_JS = IMAGE_SOURCE_JS + """
+var items = document.querySelectorAll('.ds-item');
+var sources = [];
+for (var i = 0; i < items.length; i++) {
+    sources.push(source(items[i].querySelector('.image-horizontal')));
+}
+return sources;
+"""
+# Whether the image a page container shows has arrived: complete for an
+# <img>, a finished fetch for a CSS background. Null when it can't be told,
+# e.g. for canvas pages or once Chrome has stopped recording resource
+# timings (after 250 by default).
+IMAGE_LOADED_JS = IMAGE_SOURCE_JS + """
+var el = arguments[0];
+var img = el.tagName === 'IMG' ? el : el.querySelector('img');
+if (img) return img.complete && img.naturalWidth > 0;
+var url = source(el);
+if (!url) return null;
+if (url.indexOf('data:') === 0) return true;
+if (performance.getEntriesByName(new URL(url, document.baseURI).href).length) return true;
+return performance.getEntriesByType('resource').length >= 250 ? null : false;
+"""
+
+# The site's "not found" message, and elements only a working reader has.
+NOT_FOUND_XPATH = "/html/body/div[3]/div[4]/div/div/div[2]"
+READER_XPATH = ("//div[text()='Horizontal Follow'] | //a[contains(@class, 'hoz-next')]"
+                " | //*[contains(@class, 'ds-item')]")
+
+# Selector strategies as (name, By, value). The registry tries whichever
+# worked last on the current site and layout first.
+TOTAL_PAGES_STRATEGIES = [
+    ("hoz-total-image", By.CLASS_NAME, "hoz-total-image"),
+    ("navi-buttons-span", By.CSS_SELECTOR,
+     "div.navi-buttons:nth-child(3) > div:nth-child(2) > span:nth-child(1) > span:nth-child(2)"),
+]
+NEXT_BUTTON_STRATEGIES = [
+    ("nabu-hoz-next", By.CSS_SELECTOR, "a.nabu.nabu-left.hoz-next"),
+    ("hoz-next", By.CSS_SELECTOR, ".hoz-next"),
+]
+PREV_BUTTON_STRATEGIES = [
+    ("nabu-hoz-prev", By.CSS_SELECTOR, "a.nabu.nabu-right.hoz-prev"),
+    ("hoz-prev", By.CSS_SELECTOR, ".hoz-prev"),
+]
+
+# Jump methods for goto_page(). Each returns a truthy value when it could be
+# applied on the current page; arguments[0] is the zero-based page index.
+JUMP_WITH_JS_STATE_JS = """
+var hosts = document.querySelectorAll('.swiper, .swiper-container, [class*="swiper"]');
+for (var i = 0; i < hosts.length; i++) {
+    if (hosts[i].swiper && typeof hosts[i].swiper.slideTo === 'function') {
+        hosts[i].swiper.slideTo(arguments[0], 0);
+        return true;
+    }
+}
+return false;
+"""
+JUMP_WITH_PAGE_SELECT_JS = """
+var select = document.querySelector('select[id*="page"], select[class*="page"]');
+if (!select || arguments[0] >= select.options.length) {
+    return false;
+}
+select.selectedIndex = arguments[0];
+select.dispatchEvent(new Event('change', {bubbles: true}));
+return true;
+"""
+
+# Removes iframes that point at another host (ads, pop-unders, trackers).
+# The reader's own about:blank loading iframe is left alone.
+BLOCK_THIRD_PARTY_IFRAMES_JS = """
+(function () {
+    function isThirdParty(frame) {
+        var src = frame.getAttribute('src');
+        if (!src || src.indexOf('about:') === 0) {
+            return false;
+        }
+        try {
+            return new URL(src, location.href).hostname !== location.hostname;
+        } catch (e) {
+            return false;
+        }
+    }
+    function sweep(root) {
+        var frames = root.querySelectorAll ? root.querySelectorAll('iframe') : [];
+        for (var i = 0; i < frames.length; i++) {
+            if (isThirdParty(frames[i])) {
+                frames[i].remove();
+            }
+        }
+    }
+    new MutationObserver(function (mutations) {
+        mutations.forEach(function (m) {
+            m.addedNodes.forEach(function (node) {
+                if (node.tagName === 'IFRAME') {
+                    if (isThirdParty(node)) {
+                        node.remove();
+                    }
+                } else {
+                    sweep(node);
+                }
+            });
+        });
+    }).observe(document, {childList: true, subtree: true});
+})();
+"""
 
 
 def let_page_load():
@@ -26,30 +204,178 @@ def let_page_load():
     return loading
 
 
-def create_driver(window_width, window_height):
-    """Initialize and return a Chrome WebDriver with specified options."""
+def load_blocklist(path=BLOCKLIST_PATH):
+    """Read URL block patterns from a file, one per line, '#' for comments."""
+    if not path or not os.path.exists(path):
+        print(f"Blocklist not found at {path}, no URLs will be blocked.")
+        return []
+    patterns = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                patterns.append(line)
+    return patterns
+
+
+def apply_url_blocking(driver, patterns):
+    """Block the given URL patterns and third-party iframes via DevTools."""
+    if patterns:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument",
+                           {"source": BLOCK_THIRD_PARTY_IFRAMES_JS})
+    print(f"Blocking {len(patterns)} URL patterns and third-party iframes")
+
+
+@functools.lru_cache(maxsize=None)
+def chromedriver_path():
+    """Resolve chromedriver once per run instead of on every browser start."""
+    return ChromeDriverManager().install()
+
+
+def create_remote_driver(endpoints, options):
+    """Start a browser on the least-loaded healthy remote WebDriver endpoint.
+
+    An endpoint that fails to start a session is skipped until its next
+    health check and the next one is tried, once per endpoint.
+    """
+    for attempt in range(len(endpoints.endpoints)):
+        endpoint = endpoints.acquire()
+        try:
+            driver = webdriver.Remote(
+                command_executor=ChromeRemoteConnection(endpoint.url), options=options)
+        except Exception as e:
+            print(f"Could not start a browser on {endpoint.url}: {e}")
+            endpoints.release(endpoint, failed=True)
+            if attempt == len(endpoints.endpoints) - 1:
+                raise
+            continue
+        driver.endpoint = endpoint
+        print(f"Started a browser on {endpoint.url} "
+              f"({endpoint.active}/{endpoint.capacity} in use)")
+        return driver
+
+
+def create_driver(window_width, window_height, slot=0, record_network=False):
+    """Initialize and return a Chrome WebDriver with specified options.
+
+    Locally the browser runs on the persistent profile for `slot`, so its
+    HTTP cache and reader settings carry over from previous runs. With
+    REMOTE_WEBDRIVERS set it runs on one of those servers instead.
+    `record_network` turns on the DevTools performance log that replay.py
+    records from.
+    """
     options = Options()
-    options.add_extension(ADBLOCK_PATH)
+    if record_network:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    if ADBLOCK_PATH:
+        options.add_extension(ADBLOCK_PATH)
     options.add_argument("--window-position=-40,-40")
-    driver = webdriver.Chrome(service=Service(
-        ChromeDriverManager().install()), options=options)
+
+    endpoints = get_endpoint_pool()
+    if endpoints is not None:
+        driver = create_remote_driver(endpoints, options)
+        driver.profile = None
+    else:
+        profile = acquire_profile(slot)
+        for argument in profile.chrome_arguments():
+            options.add_argument(argument)
+        try:
+            driver = webdriver.Chrome(service=Service(
+                chromedriver_path()), options=options)
+        except Exception:
+            profile.release()
+            raise
+        driver.profile = profile
+    driver.watchdog = Watchdog(lambda stage: kill_driver(driver))
+    driver.set_page_load_timeout(NAVIGATION_DEADLINE)
     driver.set_window_size(window_width, window_height)
+    # Kept for the extra reader tabs, which are new DevTools targets.
+    driver.blocklist = load_blocklist()
+    apply_url_blocking(driver, driver.blocklist)
     return driver
 
 
-def wait_for_element(driver, by, value, timeout=2, click=False):
-    """Wait for an element to be present and optionally click it."""
+def quit_driver(driver):
+    """Close the browser and hand its profile slot back."""
+    if getattr(driver, "discarded", False):
+        return
+    watchdog = getattr(driver, "watchdog", None)
+    if watchdog is not None:
+        watchdog.stop()
+    try:
+        driver.quit()
+    except Exception as e:
+        # Already killed by the watchdog or crashed
+        print(f"Error closing browser: {e}")
+    finally:
+        release_driver_slots(driver)
+
+
+def discard_driver(driver):
+    """Kill a hung or crashed browser and hand its profile slot back.
+
+    Later quit_driver() and discard_driver() calls on it do nothing.
+    """
+    if getattr(driver, "discarded", False):
+        return
+    driver.discarded = True
+    watchdog = getattr(driver, "watchdog", None)
+    if watchdog is not None:
+        watchdog.stop()
+    try:
+        kill_driver(driver)
+    finally:
+        release_driver_slots(driver)
+
+
+def release_driver_slots(driver):
+    """Hand back the profile slot or remote endpoint session a browser used."""
+    profile = getattr(driver, "profile", None)
+    if profile is not None:
+        profile.release()
+        driver.profile = None
+    endpoint = getattr(driver, "endpoint", None)
+    if endpoint is not None:
+        get_endpoint_pool().release(endpoint)
+        driver.endpoint = None
+
+
+def log_run_event(folder, message):
+    """Print a message and append it, timestamped, to the run log."""
+    print(message)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, RUN_LOG_NAME), "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}\n")
+    except OSError as e:
+        print(f"Could not write run log: {e}")
+
+
+def wait_for_element(driver, by, value, timeout=None, click=False, operation="element"):
+    """Wait for an element to be present and optionally click it.
+
+    Without an explicit `timeout` the wait is tuned from recent latencies of
+    `operation`, and this wait is recorded for it.
+    """
+    tuned = timeout is None
+    if tuned:
+        timeout = get_tuner().timeout(operation)
+    started = time.time()
     try:
         element = WebDriverWait(driver, timeout).until(
             EC.element_to_be_clickable((by, value))
         )
+        if tuned:
+            get_tuner().observe(operation, time.time() - started)
         # print(f"Element found: {element.get_attribute('outerHTML')}")
 
         if click:
             # Scroll the element into view before clicking to avoid interception
             driver.execute_script(
                 "arguments[0].scrollIntoView(true);", element)
-            print("Scrolled to element")
+            emit("scroll", "Scrolled to element", "debug", stage=operation)
 
             # try:
             #     element.click()  # Try a native click
@@ -58,14 +384,49 @@ def wait_for_element(driver, by, value, timeout=2, click=False):
             #     print(f"Native click failed: {e}")
             # Fallback to JS click
             driver.execute_script("arguments[0].click();", element)
-            print("JavaScript click executed")
+            emit("click", "JavaScript click executed", "debug", stage=operation,
+                 duration=time.time() - started)
 
         return element
     except Exception as e:
-        print(f"Error waiting for element {value}: {e}")
+        if tuned and isinstance(e, TimeoutException):
+            get_tuner().timed_out(operation, timeout)
+        emit("wait_failed", f"Error waiting for element {value}: {e}", "info",
+             stage=operation, selector=value, duration=time.time() - started,
+             error=e.__class__.__name__)
         return None
 
 
+def find_with_strategies(driver, operation, strategies, timeout=None, click=False):
+    """Locate an element by trying each strategy, last known winner first.
+
+    Each strategy waits for the tuned timeout of `operation` unless
+    `timeout` is given.
+    """
+    tuner = get_tuner()
+    if timeout is None:
+        timeout = tuner.timeout(operation)
+    registry = get_registry()
+    site = urlparse(driver.current_url).netloc
+    fingerprint = layout_fingerprint(driver)
+    missed = 0
+    wasted = 0.0
+    for name, by, value in registry.order(site, fingerprint, operation, strategies):
+        started = time.time()
+        element = wait_for_element(driver, by, value, timeout=timeout, click=click)
+        if element is not None:
+            tuner.observe(operation, time.time() - started)
+            registry.record(site, fingerprint, operation, name, missed, wasted)
+            return element
+        missed += 1
+        wasted += time.time() - started
+        emit("selector_missed", f"Selector '{name}' missed for {operation}, trying the next one.",
+             stage=operation, selector=name, duration=time.time() - started)
+    tuner.timed_out(operation, timeout)
+    registry.record(site, fingerprint, operation, None, missed, wasted)
+    return None
+
+
 def extract_url_info(url):
     """Extract content type and number from the URL."""
     url_parts = url.split('/')
@@ -87,37 +448,50 @@ def extract_url_info(url):
     return content_type, number, base_url
 
 
+def chapter_metadata(url, content_type, number):
+    """Build archive metadata (series, number, language) from a reader URL."""
+    url_parts = url.rstrip('/').split('/')
+    series = None
+    language = None
+    if "read" in url_parts:
+        index = url_parts.index("read")
+        if index + 1 < len(url_parts):
+            slug_words = url_parts[index + 1].split('-')
+            # Slugs end with the site's numeric id, e.g. kaiju-no-8-1187
+            if len(slug_words) > 1 and slug_words[-1].isdigit():
+                slug_words = slug_words[:-1]
+            series = ' '.join(slug_words).title()
+        if index + 2 < len(url_parts) - 1:
+            language = url_parts[index + 2]
+
+    metadata = {"series": series, "url": url, "language": language}
+    if content_type == "volume":
+        metadata["volume"] = number
+    else:
+        metadata["number"] = number
+    return metadata
+
+
 def generate_next_url(base_url, content_type, current_number):
     """Generate the URL for the next chapter or volume."""
     next_number = current_number + 1
     return f"{base_url}/{content_type}-{next_number}"
 
 
+@traced("total_pages")
 def get_total_pages(driver):
     """Extract the total number of pages from the webpage."""
 
-    print("loading page for 10 seconds")
-    let_page_load()
+    emit("page_load_wait", "loading page for 10 seconds", "debug", stage="total_pages")
+    with span("load_wait"):
+        let_page_load()
 
     try:
-        # Try to find the page count element using the first method
-        page_count_element = wait_for_element(
-            driver, By.CLASS_NAME, "hoz-total-image", timeout=2
-        )
-
+        page_count_element = find_with_strategies(
+            driver, "total_pages", TOTAL_PAGES_STRATEGIES)
         if page_count_element is None:
-            print("Falling back to alternate method due to missing 'hoz-total-image'.")
-
-            # Fallback: Use an alternate method (CSS Selector or XPath)
-            page_count_element = wait_for_element(
-                driver,
-                By.CSS_SELECTOR,
-                "div.navi-buttons:nth-child(3) > div:nth-child(2) > span:nth-child(1) > span:nth-child(2)",
-                timeout=2
-            )
-            if page_count_element is None:
-                raise ValueError(
-                    "Failed to locate page count element using both methods.")
+            raise ValueError(
+                "Failed to locate page count element using any known selector.")
 
         # Extract the total page count
         total_pages = int(page_count_element.text)
@@ -125,33 +499,62 @@ def get_total_pages(driver):
         if total_pages <= 0:
             raise ValueError(f"Invalid page count ({total_pages}) detected.")
 
-        print(f"Extracted total pages: {total_pages}")
+        emit("total_pages", f"Extracted total pages: {total_pages}", stage="total_pages",
+             pages=total_pages)
         return total_pages
 
     except Exception as e:
-        print(f"Error extracting total pages: {e}")
+        emit("total_pages_failed", f"Error extracting total pages: {e}", "error",
+             stage="total_pages")
         raise  # Re-raise the exception to be handled by the caller
 
 
+@traced("identify")
 def is_404_page(driver):
-    """Check if the current page is a 404 error page."""
+    """Check if the current page is a 404 error page.
+
+    Waits for either the 404 message or a piece of the reader, so a normal
+    chapter is recognised as soon as it renders instead of after a timeout.
+    """
+    tuner = get_tuner()
+    timeout = tuner.timeout("page_identified")
+    started = time.time()
     try:
-        WebDriverWait(driver, 2).until(
-            EC.presence_of_element_located(
-                (By.XPATH, "/html/body/div[3]/div[4]/div/div/div[2]"))
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.XPATH, f"{NOT_FOUND_XPATH} | {READER_XPATH}"))
         )
-        return True
     except Exception:
+        tuner.timed_out("page_identified", timeout)
         return False
+    tuner.observe("page_identified", time.time() - started)
+    return bool(driver.find_elements(By.XPATH, NOT_FOUND_XPATH))
 
 
+@traced("navigate")
 def navigate_and_prepare(driver, url):
     """Navigate to the URL and prepare the page for screenshot capture."""
-    driver.get(url)
+    with deadline(driver, "navigation", NAVIGATION_DEADLINE), span("load"):
+        driver.get(url)
+    forget_layout(driver)
     if is_404_page(driver):
         return False
-    wait_for_element(driver, By.XPATH,
-                     "//div[text()='Horizontal Follow']", click=True)
+
+    # A warm profile remembers the reading mode, so skip the setup click
+    # when the horizontal reader is already on screen.
+    profile = getattr(driver, "profile", None)
+    if (profile is not None
+            and profile.settings.get("reading_mode") == "Horizontal Follow"
+            and driver.find_elements(By.CSS_SELECTOR, "a.hoz-next")):
+        emit("setup_skipped", "Reader already in Horizontal Follow, skipping setup", "debug",
+             stage="setup")
+        return True
+
+    with span("setup"):
+        mode_button = wait_for_element(driver, By.XPATH,
+                                       "//div[text()='Horizontal Follow']", click=True)
+    if mode_button is not None and profile is not None:
+        profile.settings["reading_mode"] = "Horizontal Follow"
+        profile.save_settings()
     return True
 
 
@@ -180,16 +583,157 @@ def navigate_and_prepare(driver, url):
 # this is something to do with the loading screen <iframe src="about:blank" style="position: absolute; width: 1px; height: 1px; display: none; opacity: 0;"></iframe>
 
 
-def capture_and_save_screenshot(element, folder, page_number):
-    """Capture a screenshot of the given element and save it with zero-padded numbering."""
-    filename = os.path.join(folder, f"{page_number:03d}.jpg")
-    os.makedirs(folder, exist_ok=True)
+class BadFrameError(Exception):
+    """Raised when every capture of a page came out blank or half loaded."""
+
+
+@traced("capture")
+def capture_and_save_screenshot(element, sink, page_number):
+    """Capture a screenshot of the given element and hand it to the output sink.
+
+    Frames that look blank, like a loading spinner or only partly painted are
+    re-shot after a short pause instead of being saved. A frame that stays
+    exactly the same through every re-shot is kept as a genuinely sparse
+    page (e.g. a blank page in the book) only if its image has loaded;
+    otherwise BadFrameError sends the caller down the refresh path.
+    """
     try:
-        time.sleep(3)
-        element.screenshot(filename)
-        print(f"Screenshot saved: {filename}")
+        with span("settle"):
+            time.sleep(CAPTURE_SETTLE)
+        started = time.time()
+        check_frames = imaging_available()
+        previous = None
+        for attempt in range(CAPTURE_RETRIES + 1):
+            with deadline(element.parent, "capture", CAPTURE_DEADLINE), \
+                    span("screenshot", attempt=attempt + 1):
+                data = element.screenshot_as_png
+            with span("probe"):
+                problem, page_hash = inspect_frame(data) if check_frames else (None, None)
+            if problem is None:
+                break
+            if attempt == CAPTURE_RETRIES:
+                if data == previous and image_loaded(element) is not False:
+                    emit("frame_kept", f"Page {page_number:03d} looks {problem} but is stable, "
+                                       f"keeping it", "warning", stage="capture",
+                         page=page_number, problem=problem)
+                    break
+                raise BadFrameError(
+                    f"Page {page_number:03d} still looks {problem} after "
+                    f"{CAPTURE_RETRIES} recaptures.")
+            emit("recapture", f"Page {page_number:03d} looks {problem}, recapturing",
+                 stage="capture", page=page_number, problem=problem, attempt=attempt + 1)
+            previous = data
+            time.sleep(CAPTURE_RETRY_DELAY)
+        note_source(sink, page_number, image_source(element), page_hash)
+        with span("write"):
+            saved_as = sink.write_page(page_number, data)
+        emit("page_saved", f"Screenshot saved: {saved_as}", stage="capture",
+             page=page_number, duration=time.time() - started, bytes=len(data))
+        return page_hash
+    except (BadFrameError, WatchdogTimeout, ChapterStopped):
+        raise  # Let process_page_forward() fall back to a full refresh or stop
     except Exception as e:
-        print(f"Error capturing screenshot: {e}")
+        emit("capture_failed", f"Error capturing screenshot: {e}", "error", stage="capture",
+             page=page_number, error=e.__class__.__name__)
+        return None
+
+
+def image_loaded(element):
+    """Return whether a page element's image has loaded, or None if unknown."""
+    try:
+        return element.parent.execute_script(IMAGE_LOADED_JS, element)
+    except Exception:
+        return None
+
+
+def image_source(element):
+    """Return the URL of the image a page element shows, or None."""
+    try:
+        return element.parent.execute_script(IMAGE_SOURCE_OF_ELEMENT_JS, element)
+    except Exception:
+        return None
+
+
+def page_sources(driver):
+    """Return the image URL of every page in the reader, in page order.
+
+    Entries are None where the reader hasn't loaded the page or draws it
+    on a canvas.
+    """
+    try:
+        return driver.execute_script(PAGE_SOURCES_JS) or []
+    except Exception:
+        return []
+
+
+def get_active_index(driver):
+    """Return the reader's active page index, or None if it can't be read."""
+    try:
+        index = driver.execute_script(ACTIVE_INDEX_JS)
+    except Exception:
+        return None
+    return index if isinstance(index, int) and index >= 0 else None
+
+
+def page_has_advanced(driver, previous_index, previous_hash):
+    """Check once whether the reader has moved on to the next page.
+
+    The active slide index is checked first and must be exactly one further;
+    a reader that turned two pages (a retried click landing twice) is sent
+    back to the next page. When the DOM doesn't expose the index, the
+    perceptual hash of the visible page is compared with the last capture.
+    """
+    if previous_index is not None:
+        index = get_active_index(driver)
+        if index is not None and index > previous_index + 1:
+            emit("overshot", f"Reader went {index - previous_index} pages ahead, going back",
+                 "warning", stage="next", target=previous_index + 2)
+            return goto_page(driver, previous_index + 2)
+        return index == previous_index + 1
+    if previous_hash is not None:
+        try:
+            image_element = driver.find_element(
+                By.CSS_SELECTOR, ".ds-item.active .image-horizontal")
+            return not is_duplicate(dhash(image_element.screenshot_as_png),
+                                    previous_hash)
+        except Exception:
+            return False
+    return True  # Nothing to compare against
+
+
+def confirm_page_advanced(driver, previous_index, previous_hash, timeout=None):
+    """Wait until the reader shows a different page than before the click."""
+    tuner = get_tuner()
+    if timeout is None:
+        timeout = tuner.timeout("page_advance")
+    started = time.time()
+    while True:
+        if page_has_advanced(driver, previous_index, previous_hash):
+            tuner.observe("page_advance", time.time() - started)
+            return True
+        if time.time() >= started + timeout:
+            tuner.timed_out("page_advance", timeout)
+            return False
+        time.sleep(0.2)
+
+
+@traced("next")
+def click_next_and_confirm(driver, previous_hash):
+    """Click 'Next' and make sure the reader actually moved on."""
+    previous_index = get_active_index(driver)
+    started = time.time()
+    for attempt in range(NEXT_CLICK_RETRIES):
+        find_with_strategies(
+            driver, "next_button", NEXT_BUTTON_STRATEGIES, click=True
+        )
+        if confirm_page_advanced(driver, previous_index, previous_hash):
+            emit("page_advanced", None, "debug", stage="next",
+                 duration=time.time() - started, clicks=attempt + 1)
+            return True
+        emit("next_not_advanced", f"Page did not advance after clicking Next "
+                                  f"({attempt + 1}/{NEXT_CLICK_RETRIES})", "warning",
+             stage="next", attempt=attempt + 1)
+    return False
 
 
 # def process_page_forward(driver, folder, page_number, total_pages, delay):
@@ -236,9 +780,109 @@ def capture_and_save_screenshot(element, folder, page_number):
 #                 )
 
 
-def process_page_forward(driver, folder, page_number, total_pages):
-    """Capture screenshot and click 'Next' to move forward."""
-    print(f"Processing page: {page_number} / {total_pages - 1}")
+def wait_for_active_index(driver, index, timeout=None):
+    """Wait until the reader's active page index equals `index`."""
+    tuner = get_tuner()
+    if timeout is None:
+        timeout = tuner.timeout("page_jump")
+    started = time.time()
+    while True:
+        if get_active_index(driver) == index:
+            tuner.observe("page_jump", time.time() - started)
+            return True
+        if time.time() >= started + timeout:
+            tuner.timed_out("page_jump", timeout)
+            return False
+        time.sleep(0.2)
+
+
+def _jump_with_js_state(driver, index):
+    return driver.execute_script(JUMP_WITH_JS_STATE_JS, index)
+
+
+def _jump_with_page_select(driver, index):
+    return driver.execute_script(JUMP_WITH_PAGE_SELECT_JS, index)
+
+
+def _jump_with_fragment(driver, index):
+    driver.execute_script("location.hash = arguments[0];", f"#page-{index + 1}")
+    return True
+
+
+def _jump_by_stepping(driver, index):
+    """Click Next/Prev from the current page until `index` is reached."""
+    current = get_active_index(driver)
+    if current is None:
+        return False
+    while current != index:
+        if current < index:
+            strategies, step = NEXT_BUTTON_STRATEGIES, 1
+        else:
+            strategies, step = PREV_BUTTON_STRATEGIES, -1
+        find_with_strategies(driver, "step_button", strategies, click=True)
+        if not wait_for_active_index(driver, current + step):
+            return False
+        current += step
+    return True
+
+
+GOTO_PAGE_STRATEGIES = [
+    ("js-state", _jump_with_js_state),
+    ("page-select", _jump_with_page_select),
+    ("url-fragment", _jump_with_fragment),
+    ("step", _jump_by_stepping),
+]
+
+
+@traced("goto")
+def goto_page(driver, page_number, timeout=None):
+    """Jump the reader straight to `page_number` (1-based) and confirm arrival.
+
+    The fastest jump method that worked last time on this site is tried
+    first; clicking through pages one by one is the last resort.
+    """
+    index = page_number - 1
+    if get_active_index(driver) == index:
+        return True
+
+    registry = get_registry()
+    site = urlparse(driver.current_url).netloc
+    fingerprint = layout_fingerprint(driver)
+    missed = 0
+    wasted = 0.0
+    for name, jump in registry.order(site, fingerprint, "goto_page", GOTO_PAGE_STRATEGIES):
+        started = time.time()
+        try:
+            applied = jump(driver, index)
+        except Exception as e:
+            emit("jump_error", f"Jump method '{name}' failed: {e}", "debug", stage="goto",
+                 method=name)
+            applied = False
+        if applied and wait_for_active_index(driver, index, timeout):
+            registry.record(site, fingerprint, "goto_page", name, missed, wasted)
+            emit("jumped", f"Jumped to page {page_number} via {name}", stage="goto",
+                 target=page_number, method=name, duration=time.time() - started)
+            return True
+        missed += 1
+        wasted += time.time() - started
+    registry.record(site, fingerprint, "goto_page", None, missed, wasted)
+    emit("jump_failed", f"Could not jump to page {page_number}", "warning", stage="goto",
+         target=page_number, duration=wasted)
+    return False
+
+
+@traced("page")
+def process_page_forward(driver, sink, page_number, total_pages, previous_hash=None):
+    """Capture screenshot and click 'Next' to move forward.
+
+    Returns the perceptual hash of the captured page, which the next call
+    uses to flag a page that repeats the one before it.
+    """
+    emit("page_started", f"Processing page: {page_number} / {total_pages - 1}", "debug",
+         stage="page")
+    started = time.time()
+    check_watchdog(driver)
+    page_hash = None
 
     if page_number < total_pages:
         max_retries = 5
@@ -248,9 +892,10 @@ def process_page_forward(driver, folder, page_number, total_pages):
         for attempt in range(max_retries):
             try:
                 # Ensure the active container is loaded
-                active_container = wait_for_element(
-                    driver, By.CSS_SELECTOR, ".ds-item.active", timeout=10
-                )
+                with span("wait"):
+                    active_container = wait_for_element(
+                        driver, By.CSS_SELECTOR, ".ds-item.active", operation="reader"
+                    )
 
                 if not active_container:
                     raise Exception("Active container not found.")
@@ -262,13 +907,18 @@ def process_page_forward(driver, folder, page_number, total_pages):
                 if not image_element:
                     raise Exception("Image element not found.")
 
-                capture_and_save_screenshot(image_element, folder, page_number)
+                page_hash = capture_and_save_screenshot(
+                    image_element, sink, page_number)
                 break  # Successfully captured the screenshot, exit retry loop
 
+            except (WatchdogTimeout, ChapterStopped):
+                raise  # The browser is gone or the chapter was stopped
             except Exception as e:
                 if attempt < max_retries - 1:
-                    print(
-                        f"Retry {attempt + 1}/{max_retries} for '.image-horizontal'")
+                    emit("page_retry", f"Retry {attempt + 1}/{max_retries} for "
+                                       f"'.image-horizontal'", "warning", stage="page",
+                         attempt=attempt + 1, error=str(e).strip().splitlines()[0]
+                         if str(e).strip() else e.__class__.__name__)
 
                     # **Check if we are stuck on the same page**
                     current_url = driver.current_url
@@ -278,39 +928,235 @@ def process_page_forward(driver, folder, page_number, total_pages):
                         same_page_retries = 0  # Reset if page actually changes
 
                     if same_page_retries >= 3:  # If stuck, log error and break
-                        print(
-                            "Detected repeated retries on the same page. Moving forward.")
+                        emit("page_skipped", "Detected repeated retries on the same page. "
+                                             "Moving forward.", "error", stage="page")
                         break
-                    time.sleep(5)
-                    driver.refresh()
-                    time.sleep(5)  # Short pause to allow the refresh
-
-                    # **Wait again for the content to load**
-                    wait_for_element(driver, By.CSS_SELECTOR,
-                                     ".ds-item.active", timeout=15)
-                    time.sleep(3)  # Additional buffer to ensure stability
+                    with span("retry", attempt=attempt + 1):
+                        time.sleep(5)
+                        with deadline(driver, "navigation", NAVIGATION_DEADLINE):
+                            driver.refresh()
+                        time.sleep(5)  # Short pause to allow the refresh
+
+                        # **Wait again for the content to load**
+                        wait_for_element(driver, By.CSS_SELECTOR,
+                                         ".ds-item.active", operation="reader")
+                        # A refresh can drop the reader back to the first page
+                        goto_page(driver, page_number)
+                        time.sleep(3)  # Additional buffer to ensure stability
                 else:
-                    print(
-                        f"Failed to locate '.image-horizontal' after {max_retries} attempts: {str(e)}")
-                    input("Pausing for debugging. Press Enter to continue...")
+                    emit("page_failed", f"Failed to locate '.image-horizontal' after "
+                                        f"{max_retries} attempts: {str(e)}", "error",
+                         stage="page", attempts=max_retries)
+                    if PAUSE_ON_FAILURE:
+                        input("Pausing for debugging. Press Enter to continue...")
                     raise Exception(
                         f"Failed to locate '.image-horizontal' after {max_retries} attempts: {str(e)}")
 
+        if is_duplicate(page_hash, previous_hash):
+            emit("duplicate_page", f"Warning: page {page_number:03d} looks identical to the "
+                                   f"page before it (distance "
+                                   f"{hamming(page_hash, previous_hash)})", "warning",
+                 stage="page")
+
         # Click "Next" if not on the last page
         if page_number < total_pages - 1:
-            next_button = wait_for_element(
-                driver, By.CSS_SELECTOR, "a.nabu.nabu-left.hoz-next", timeout=5, click=True
-            )
+            if not click_next_and_confirm(driver, page_hash):
+                emit("stuck", f"Warning: reader did not move past page {page_number:03d}, "
+                              f"jumping", "warning", stage="next")
+                if not goto_page(driver, page_number + 1):
+                    raise Exception(f"Reader is stuck on page {page_number:03d}.")
+
+    emit("page_done", None, stage="page", duration=time.time() - started)
+    return page_hash
+
+
+def split_page_ranges(first_page, last_page, parts):
+    """Split pages first..last (inclusive) into `parts` contiguous ranges."""
+    count = last_page - first_page + 1
+    parts = max(1, min(parts, count))
+    size, extra = divmod(count, parts)
+    ranges = []
+    start = first_page
+    for part in range(parts):
+        end = start + size - 1 + (1 if part < extra else 0)
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def open_reader_tab(driver, url, page_number):
+    """Open the chapter in a new browser window at `page_number`."""
+    size = driver.get_window_size()
+    driver.switch_to.new_window('window')
+    driver.set_window_size(size["width"], size["height"])
+    # URL blocking is set per tab, so the new one needs it too.
+    apply_url_blocking(driver, getattr(driver, "blocklist", []))
+    if not navigate_and_prepare(driver, url):
+        raise Exception(f"Could not open {url} in another tab.")
+    wait_for_element(driver, By.CSS_SELECTOR, ".ds-item.active", operation="reader")
+    if not goto_page(driver, page_number):
+        raise Exception(f"Could not jump to page {page_number} in a new tab.")
+    return driver.current_window_handle
+
+
+def _tab_step(driver, tab, sink):
+    """Move one tab forward by a single non-blocking step.
+
+    A step is confirming the reader arrived on the page, or capturing it and
+    clicking Next. Returns False when the tab is still waiting on the site,
+    so the caller can visit the other tabs in the meantime.
+    """
+    page = tab["page"]
+    track = f"tab {tab['id']}"
+    if tab["advancing"]:
+        if page_has_advanced(driver, tab["previous_index"], tab["hash"]):
+            get_tuner().observe("page_advance", time.time() - tab["clicked"])
+            record("advance", tab["clicked"], time.time(), track, page=page)
+        else:
+            if time.time() < tab["deadline"]:
+                return False
+            get_tuner().timed_out("page_advance", tab["deadline"] - tab["clicked"])
+            record("advance", tab["clicked"], time.time(), track, page=page, timed_out=True)
+            emit("tab_jump", f"Tab {tab['id']}: reader didn't reach page {page:03d}, jumping",
+                 "warning", stage="next", tab=tab["id"], page=page)
+            if not goto_page(driver, page):
+                raise Exception(f"Tab {tab['id']} is stuck before page {page:03d}.")
+        tab["advancing"] = False
+        tab["arrived"] = time.time()
+        return True
+
+    if time.time() - tab["arrived"] < CAPTURE_SETTLE:
+        return False
+
+    data = page_hash = None
+    try:
+        image_element = driver.find_element(
+            By.CSS_SELECTOR, ".ds-item.active .image-horizontal")
+        with deadline(driver, "capture", CAPTURE_DEADLINE), \
+                span("screenshot", tab=tab["id"], page=page):
+            data = image_element.screenshot_as_png
+        with span("probe", tab=tab["id"], page=page):
+            problem, page_hash = inspect_frame(data) if imaging_available() else (None, None)
+    except WatchdogTimeout:
+        raise
+    except Exception as e:
+        problem = f"missing ({e.__class__.__name__})"
+
+    if problem is not None:
+        stable = data is not None and data == tab["last_frame"]
+        tab["last_frame"] = data
+        tab["bad_frames"] += 1
+        if tab["bad_frames"] <= CAPTURE_RETRIES:
+            # Look again after the retry delay, other tabs run meanwhile
+            tab["arrived"] = time.time() - CAPTURE_SETTLE + CAPTURE_RETRY_DELAY
+            return False
+        if stable and image_loaded(image_element) is not False:
+            emit("frame_kept", f"Tab {tab['id']}: page {page:03d} looks {problem} but is "
+                               f"stable, keeping it", "warning", stage="capture",
+                 tab=tab["id"], page=page, problem=problem)
+        else:
+            tab["refreshes"] += 1
+            if tab["refreshes"] >= 5:
+                raise Exception(
+                    f"Tab {tab['id']}: page {page:03d} still {problem} after 5 refreshes.")
+            emit("tab_refresh", f"Tab {tab['id']}: page {page:03d} looks {problem}, refreshing",
+                 "warning", stage="capture", tab=tab["id"], page=page, problem=problem)
+            with span("retry", tab=tab["id"], page=page):
+                with deadline(driver, "navigation", NAVIGATION_DEADLINE):
+                    driver.refresh()
+                wait_for_element(driver, By.CSS_SELECTOR, ".ds-item.active", operation="reader")
+                goto_page(driver, page)
+            tab.update(bad_frames=0, last_frame=None, arrived=time.time())
+            return True
+
+    note_source(sink, page, image_source(image_element), page_hash)
+    with span("write", tab=tab["id"], page=page):
+        saved_as = sink.write_page(page, data)
+    record("page", tab["arrived"], time.time(), track, page=page)
+    emit("page_saved", f"Tab {tab['id']}: screenshot saved: {saved_as}", stage="capture",
+         tab=tab["id"], page=page, duration=time.time() - tab["arrived"], bytes=len(data))
+    if is_duplicate(page_hash, tab["hash"]):
+        emit("duplicate_page", f"Warning: page {page:03d} looks identical to the page "
+                               f"before it", "warning", stage="capture", tab=tab["id"], page=page)
+    tab.update(page=page + 1, hash=page_hash, bad_frames=0, refreshes=0,
+               last_frame=None)
+
+    if tab["page"] > tab["end"]:
+        tab["done"] = True
+        return True
+    tab["previous_index"] = get_active_index(driver)
+    find_with_strategies(
+        driver, "next_button", NEXT_BUTTON_STRATEGIES, click=True)
+    clicked = time.time()
+    tab.update(advancing=True, clicked=clicked,
+               deadline=clicked + get_tuner().timeout("page_advance"))
+    return True
+
+
+@traced("tabs")
+def capture_with_tabs(driver, url, sink, first_page, last_page, tabs):
+    """Capture a page range using several windows of the same browser.
+
+    Each window gets a contiguous slice of the chapter. WebDriver runs one
+    command at a time, so the windows are visited round-robin and only ever
+    do one quick step each: while one window waits for its next page to
+    load, the others capture. All windows share the browser's session and
+    cache.
+    """
+    main_handle = driver.current_window_handle
+    tab_list = []
+    try:
+        for tab_id, (start, end) in enumerate(
+                split_page_ranges(first_page, last_page, tabs), 1):
+            if tab_id == 1:
+                handle = main_handle
+                if not goto_page(driver, start):
+                    raise Exception(f"Could not jump to page {start}.")
+            else:
+                handle = open_reader_tab(driver, url, start)
+            emit("tab_opened", f"Tab {tab_id}: pages {start}-{end}", stage="tabs",
+                 tab=tab_id, first=start, last=end)
+            tab_list.append({
+                "id": tab_id, "handle": handle, "page": start, "end": end,
+                "advancing": False, "arrived": time.time(), "deadline": 0,
+                "previous_index": None, "hash": None, "last_frame": None,
+                "bad_frames": 0, "refreshes": 0, "done": False,
+            })
+
+        while not all(tab["done"] for tab in tab_list):
+            check_watchdog(driver)
+            progressed = False
+            for tab in tab_list:
+                if tab["done"]:
+                    continue
+                driver.switch_to.window(tab["handle"])
+                progressed = _tab_step(driver, tab, sink) or progressed
+            if not progressed:
+                time.sleep(0.05)
+    finally:
+        for tab in tab_list:
+            if tab["handle"] != main_handle:
+                try:
+                    driver.switch_to.window(tab["handle"])
+                    driver.close()
+                except Exception:
+                    pass
+        driver.switch_to.window(main_handle)
 
 
 # def download_chapter(driver, url, folder, content_type, number, delay):
 
 
-def download_chapter(driver, url, folder, content_type, number):
-    """Download all pages for a single chapter or volume."""
-    formatted_number = f"{int(number):03d}"
-    download_folder = os.path.join(
-        folder, f"{content_type.lower()}-{formatted_number}")
+@traced("download_chapter")
+def download_chapter(driver, url, folder, content_type, number, start_page=1,
+                     tabs=CHAPTER_TABS, sink=None):
+    """Download all pages for a single chapter or volume.
+
+    `start_page` resumes a chapter part way through by jumping straight to
+    that page. Long chapters are split across up to `tabs` browser windows.
+    When `sink` is given the caller owns it: pages are added to it but it is
+    neither closed nor aborted here, so a retry can keep filling it.
+    """
     if not navigate_and_prepare(driver, url):
         return False
 
@@ -318,20 +1164,119 @@ def download_chapter(driver, url, folder, content_type, number):
     # if not preload_all_pages(driver, total_pages):
     #     return False
 
-    for page_num in range(1, total_pages):
-        process_page_forward(driver, download_folder,
-                             #  page_num, total_pages, delay)
-                             page_num, total_pages)
+    last_page = total_pages - 1
+    tabs = min(tabs, max(1, (last_page - start_page + 1) // MIN_PAGES_PER_TAB))
+    if tabs == 1 and 1 < start_page <= last_page and not goto_page(driver, start_page):
+        raise Exception(f"Could not jump to page {start_page} to resume.")
+
+    owns_sink = sink is None
+    if owns_sink:
+        sink = open_sink(folder, content_type, number,
+                         chapter_metadata(url, content_type, number))
+    set_page_count(sink, last_page)
+    chapter_sink = sink
+    if tabs > 1 and getattr(sink, "ordered", True):
+        chapter_sink = ReorderSink(sink, start_page)
+    try:
+        if tabs > 1:
+            emit("tabs_started", f"Capturing pages {start_page}-{last_page} with {tabs} tabs",
+                 stage="tabs", first=start_page, last=last_page, tabs=tabs)
+            capture_with_tabs(driver, url, chapter_sink, start_page, last_page, tabs)
+        else:
+            page_hash = None
+            for page_num in range(start_page, total_pages):
+                with deadline(driver, "page", PAGE_DEADLINE), context(page=page_num):
+                    page_hash = process_page_forward(driver, chapter_sink,
+                                                     #  page_num, total_pages, delay)
+                                                     page_num, total_pages, page_hash)
+    except BaseException:
+        if owns_sink:
+            chapter_sink.abort()
+        elif chapter_sink is not sink:
+            chapter_sink.release()
+        raise
+    if owns_sink:
+        chapter_sink.close()
+    elif chapter_sink is not sink:
+        chapter_sink.finish()
 
     return True
 
 
+def download_chapter_supervised(driver, new_driver, url, folder, content_type, number,
+                                saved_pages=(), on_page=None, tabs=CHAPTER_TABS,
+                                before_page=None):
+    """Run download_chapter() under hard deadlines, restarting a hung browser.
+
+    When the watchdog kills the browser or chromedriver crashes, a fresh
+    driver is made with `new_driver()` and the chapter resumes from the
+    first page that wasn't saved yet. `saved_pages` are pages an earlier
+    run already saved; they are skipped if the output still has them.
+    `before_page(page_number)` is called before each page is written and
+    may raise ChapterStopped to end the chapter; `on_page(page_number)` is
+    called after. Returns
+    (success, driver), where the driver may be a replacement for the one
+    passed in. When it raises instead, the browser in use has already been
+    discarded, so the caller's handle needs no cleanup.
+    """
+    sink = ProgressSink(ManifestSink(open_sink(folder, content_type, number,
+                                               chapter_metadata(url, content_type, number)),
+                                     url),
+                        saved_pages, on_page, before_page)
+    restarts = 0
+    started = time.time()
+    while True:
+        start_page = sink.next_missing()
+        try:
+            with deadline(driver, "chapter", CHAPTER_DEADLINE), \
+                    context(chapter=number, content_type=content_type):
+                success = download_chapter(driver, url, folder, content_type, number,
+                                           start_page=start_page, tabs=tabs, sink=sink)
+            break
+        except BROWSER_FAILURES as e:
+            restarts += 1
+            cause = f"{e.__class__.__name__}: {str(e).strip().splitlines()[0] if str(e).strip() else ''}"
+            if restarts > MAX_CHAPTER_RESTARTS:
+                log_run_event(folder, f"Giving up on {content_type} {number} after "
+                                      f"{MAX_CHAPTER_RESTARTS} browser restarts ({cause})")
+                sink.abort()
+                discard_driver(driver)
+                raise
+            mark("restart", cause=cause, restarts=restarts)
+            log_run_event(folder, f"Restarting browser ({restarts}/{MAX_CHAPTER_RESTARTS}) "
+                                  f"during {content_type} {number} at page "
+                                  f"{sink.next_missing()}: {cause}")
+            discard_driver(driver)
+            driver = new_driver()
+        except BaseException:
+            sink.abort()
+            discard_driver(driver)
+            raise
+
+    if success:
+        sink.close()
+    else:
+        sink.abort()
+    emit("chapter_done", None, stage="chapter", chapter=number, content_type=content_type,
+         success=success, pages=len(sink.done), restarts=restarts,
+         duration=time.time() - started)
+    driver.pages_captured = len(sink.done)
+    return success, driver
+
+
 def start_download():
     """Start the download process for all manga chapters or volumes."""
     # url, folder, width, height, delay = get_gui_inputs()
     url, folder, width, height = get_gui_inputs()
     content_type, number, base_url = extract_url_info(url)
-    driver = create_driver(width, height)
+
+    def new_driver():
+        return create_driver(width, height)
+
+    pool = DriverPool(new_driver, quit_driver, warm=navigate_and_prepare,
+                      log=lambda message: log_run_event(folder, message))
+    pool.set_warm_url(url)
+    driver = pool.acquire()
 
     total_chapters_processed = 0
     current_number = number
@@ -339,10 +1284,12 @@ def start_download():
 
     while True:
         print(f"Processing {content_type} {current_number}: {current_url}")
+        pool.set_warm_url(current_url)
         try:
-            success = download_chapter(
+            success, driver = download_chapter_supervised(
                 # driver, current_url, folder, content_type, current_number, delay)
-                driver, current_url, folder, content_type, current_number)
+                driver, pool.replace, current_url, folder, content_type, current_number)
+            driver = pool.checkin(driver, getattr(driver, "pages_captured", 0))
             if success:
                 total_chapters_processed += 1
                 current_number += 1
@@ -358,9 +1305,16 @@ def start_download():
 
         # update_progress(total_chapters_processed, total_chapters_processed + 1)
 
+    get_registry().report()
+    get_tuner().report()
+    pool.report()
+    endpoints = get_endpoint_pool()
+    if endpoints is not None:
+        endpoints.report()
     messagebox.showinfo("Download Complete",
                         f"Captured {total_chapters_processed} {content_type}s.")
-    driver.quit()
+    quit_driver(driver)
+    pool.close()
 
 
 def get_gui_inputs():
@@ -389,52 +1343,53 @@ def browse_folder():
 
 
 # Tkinter GUI setup
-root = tk.Tk()
-root.title("Manga Downloader")
-root.geometry("500x175")  # Fixed size
-root.resizable(False, False)  # Disable resizing
-
-root.columnconfigure(1, weight=1)
-
-tk.Label(root, text="Enter Starting URL:").grid(
-    row=0, column=0, padx=5, pady=5, sticky=tk.W)
-url_entry = tk.Entry(root, width=50)
-url_entry.grid(row=0, column=1, padx=5, pady=5, sticky=tk.EW)
-
-tk.Label(root, text="Download Folder:").grid(
-    row=1, column=0, padx=5, pady=5, sticky=tk.W)
-folder_entry = tk.Entry(root, width=50)
-folder_entry.grid(row=1, column=1, padx=5, pady=5, sticky=tk.EW)
-
-# Corrected placement of Browse button
-browse_button = tk.Button(root, text="Browse", command=browse_folder)
-browse_button.grid(row=1, column=2, padx=5, pady=5, sticky=tk.E)
-
-tk.Label(root, text="Window Width:").grid(
-    row=2, column=0, padx=5, pady=5, sticky=tk.W)
-width_entry = tk.Entry(root, width=10)
-width_entry.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
-width_entry.insert(0, "1450")
-
-tk.Label(root, text="Window Height:").grid(
-    row=3, column=0, padx=5, pady=5, sticky=tk.W)
-height_entry = tk.Entry(root, width=10)
-height_entry.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
-height_entry.insert(0, "1934")
-
-# tk.Label(root, text="Delay between 'Next' clicks (ms):").grid(
-#     row=4, column=0, padx=5, pady=5, sticky=tk.W)
-# delay_slider = tk.Scale(root, from_=0, to=2000,
-#                         orient="horizontal", length=200)
-# delay_slider.grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
-# delay_slider.set(100)
-
-# progress_bar = ttk.Progressbar(
-#     root, orient="horizontal", length=400, mode="determinate")
-# progress_bar.grid(row=5, column=0, columnspan=3, pady=10, sticky=tk.EW)
-
-start_button = tk.Button(root, text="Start Download",
-                         command=start_download, bg="green", fg="white")
-start_button.grid(row=6, column=0, columnspan=3, pady=10)
-
-root.mainloop()
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.title("Manga Downloader")
+    root.geometry("500x175")  # Fixed size
+    root.resizable(False, False)  # Disable resizing
+
+    root.columnconfigure(1, weight=1)
+
+    tk.Label(root, text="Enter Starting URL:").grid(
+        row=0, column=0, padx=5, pady=5, sticky=tk.W)
+    url_entry = tk.Entry(root, width=50)
+    url_entry.grid(row=0, column=1, padx=5, pady=5, sticky=tk.EW)
+
+    tk.Label(root, text="Download Folder:").grid(
+        row=1, column=0, padx=5, pady=5, sticky=tk.W)
+    folder_entry = tk.Entry(root, width=50)
+    folder_entry.grid(row=1, column=1, padx=5, pady=5, sticky=tk.EW)
+
+    # Corrected placement of Browse button
+    browse_button = tk.Button(root, text="Browse", command=browse_folder)
+    browse_button.grid(row=1, column=2, padx=5, pady=5, sticky=tk.E)
+
+    tk.Label(root, text="Window Width:").grid(
+        row=2, column=0, padx=5, pady=5, sticky=tk.W)
+    width_entry = tk.Entry(root, width=10)
+    width_entry.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
+    width_entry.insert(0, "1450")
+
+    tk.Label(root, text="Window Height:").grid(
+        row=3, column=0, padx=5, pady=5, sticky=tk.W)
+    height_entry = tk.Entry(root, width=10)
+    height_entry.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+    height_entry.insert(0, "1934")
+
+    # tk.Label(root, text="Delay between 'Next' clicks (ms):").grid(
+    #     row=4, column=0, padx=5, pady=5, sticky=tk.W)
+    # delay_slider = tk.Scale(root, from_=0, to=2000,
+    #                         orient="horizontal", length=200)
+    # delay_slider.grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+    # delay_slider.set(100)
+
+    # progress_bar = ttk.Progressbar(
+    #     root, orient="horizontal", length=400, mode="determinate")
+    # progress_bar.grid(row=5, column=0, columnspan=3, pady=10, sticky=tk.EW)
+
+    start_button = tk.Button(root, text="Start Download",
+                             command=start_download, bg="green", fg="white")
+    start_button.grid(row=6, column=0, columnspan=3, pady=10)
+
+    root.mainloop()
@@ -0,0 +1,259 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from imaging import dhash, hamming, imaging_available
+
+# Content-addressed page store. Every page is kept once under its SHA-256 and
+# chapter folders get hard links to it. Empty disables the store, "1" puts it
+# in a hidden .pages folder inside the download folder, anything else is
+# used as the store path (it must be on the same drive as the downloads).
+PAGE_STORE = os.getenv('PAGE_STORE', '')
+# Pages whose perceptual hashes differ in at most this many bits are recorded
+# as near-duplicates. The band index only finds pages up to 3 bits apart, so
+# larger values are capped at 3.
+NEAR_DUPLICATE_DISTANCE = min(3, int(os.getenv('NEAR_DUPLICATE_DISTANCE', '2')))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def _bands(page_hash):
+    """Split a 64-bit hash into four 16-bit bands.
+
+    Two hashes within 3 bits of each other always share at least one band
+    exactly, so candidates can be found with indexed lookups.
+    """
+    return [(page_hash >> shift) & 0xFFFF for shift in (48, 32, 16, 0)]
+
+
+def _signed(value):
+    """Fit an unsigned 64-bit hash into SQLite's signed INTEGER."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class PageStore:
+    """Pages stored once by content hash, with a perceptual-hash index."""
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"),
+                                   timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                phash INTEGER,
+                band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+                first_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pages_band0 ON pages (band0);
+            CREATE INDEX IF NOT EXISTS pages_band1 ON pages (band1);
+            CREATE INDEX IF NOT EXISTS pages_band2 ON pages (band2);
+            CREATE INDEX IF NOT EXISTS pages_band3 ON pages (band3);
+            CREATE TABLE IF NOT EXISTS near_duplicates (
+                sha256 TEXT NOT NULL,
+                match TEXT NOT NULL,
+                distance INTEGER NOT NULL,
+                PRIMARY KEY (sha256, match)
+            );
+            CREATE TABLE IF NOT EXISTS links (
+                path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _find_near_duplicate(self, page_hash, digest):
+        """Return (sha256, distance) of the closest stored page, or None."""
+        bands = _bands(page_hash)
+        rows = self._db.execute(
+            "SELECT sha256, phash FROM pages WHERE sha256 != ? AND phash IS NOT NULL "
+            "AND (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)",
+            [digest] + bands).fetchall()
+        best = None
+        for other, other_hash in rows:
+            distance = hamming(page_hash, _unsigned(other_hash))
+            if distance <= NEAR_DUPLICATE_DISTANCE and (best is None or distance < best[1]):
+                best = (other, distance)
+        return best
+
+    def put(self, data):
+        """Store page bytes if they are new and return their SHA-256.
+
+        Identical bytes are only ever written once. A near-duplicate is still
+        stored as its own page; only its relation to the stored copy is recorded.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM pages WHERE sha256 = ?",
+                                (digest,)).fetchone() and os.path.exists(path):
+                return digest
+
+            page_hash = None
+            if imaging_available():
+                try:
+                    page_hash = dhash(data)
+                except Exception as e:
+                    print(f"Could not hash page {digest[:12]}: {e}")
+
+            if page_hash is not None:
+                match = self._find_near_duplicate(page_hash, digest)
+                if match is not None:
+                    self._db.execute(
+                        "INSERT OR IGNORE INTO near_duplicates VALUES (?, ?, ?)",
+                        (digest, match[0], match[1]))
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            bands = _bands(page_hash) if page_hash is not None else [None] * 4
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [digest, len(data),
+                 _signed(page_hash) if page_hash is not None else None]
+                + bands + [time.time()])
+            self._db.commit()
+        return digest
+
+    def link(self, digest, destination):
+        """Point `destination` at a stored page, copying if hard links fail."""
+        source = self.object_path(digest)
+        tmp_path = destination + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            # Different drive or a filesystem without hard links.
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO links VALUES (?, ?)",
+                             (os.path.abspath(destination), digest))
+            self._db.commit()
+        return destination
+
+    def store_page(self, data, destination):
+        """Store page bytes and link them into a chapter folder."""
+        return self.link(self.put(data), destination)
+
+    def stats(self):
+        """Return counts and byte totals for the store."""
+        with self._lock:
+            pages, stored_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+            links, linked_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pages.size), 0) FROM links "
+                "JOIN pages USING (sha256)").fetchone()
+            near = self._db.execute(
+                "SELECT COUNT(*) FROM near_duplicates").fetchone()[0]
+        return {
+            "pages": pages,
+            "stored_bytes": stored_bytes,
+            "links": links,
+            "linked_bytes": linked_bytes,
+            "saved_bytes": linked_bytes - stored_bytes,
+            "near_duplicates": near,
+        }
+
+    def near_duplicates(self):
+        """Return (path, matching path, distance) for recorded near-duplicates."""
+        with self._lock:
+            return self._db.execute("""
+                SELECT a.path, b.path, n.distance FROM near_duplicates n
+                JOIN links a ON a.sha256 = n.sha256
+                JOIN links b ON b.sha256 = n.match
+                GROUP BY n.sha256, n.match
+            """).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_root(download_folder, setting=PAGE_STORE):
+    """Resolve the PAGE_STORE setting to a directory, or None when disabled."""
+    if not setting or setting.lower() in ("0", "off", "false"):
+        return None
+    if setting.lower() in ("1", "on", "true"):
+        return os.path.join(download_folder, ".pages")
+    return setting
+
+
+def get_page_store(download_folder, setting=PAGE_STORE):
+    """Return the shared PageStore for a download folder, or None when disabled."""
+    root = store_root(download_folder, setting)
+    if root is None:
+        return None
+    root = os.path.abspath(root)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = PageStore(root)
+        return _stores[root]
+
+
+def dedupe_library(library, store):
+    """Move every page under `library` into the store and replace it with a link."""
+    store_root_path = os.path.abspath(store.root)
+    for directory, subdirectories, files in os.walk(library):
+        directory_path = os.path.abspath(directory)
+        if os.path.commonpath([directory_path, store_root_path]) == store_root_path:
+            subdirectories[:] = []
+            continue
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                digest = store.put(f.read())
+            store.link(digest, path)
+    return store.stats()
+
+
+def _print_stats(stats):
+    print(f"Unique pages stored: {stats['pages']} ({stats['stored_bytes'] / 1e6:.1f} MB)")
+    print(f"Pages linked into chapters: {stats['links']} "
+          f"({stats['linked_bytes'] / 1e6:.1f} MB)")
+    print(f"Saved by deduplication: {stats['saved_bytes'] / 1e6:.1f} MB")
+    print(f"Near-duplicate pairs found: {stats['near_duplicates']}")
+
+
+if __name__ == "__main__":
+    # python pagestore.py dedupe|stats|near <download folder>
+    if len(sys.argv) != 3 or sys.argv[1] not in ("dedupe", "stats", "near"):
+        sys.exit("Usage: python pagestore.py dedupe|stats|near <download folder>")
+    command, folder = sys.argv[1], sys.argv[2]
+    page_store = get_page_store(folder, PAGE_STORE or "1")
+    if command == "dedupe":
+        _print_stats(dedupe_library(folder, page_store))
+    elif command == "stats":
+        _print_stats(page_store.stats())
+    else:
+        for path, match, distance in page_store.near_duplicates():
+            print(f"{path} ~ {match} (distance {distance})")
@@ -0,0 +1,163 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import psutil
+except ImportError:  # Without psutil browsers are only recycled by page count
+    psutil = None
+
+# Recycle a browser once Chrome and its renderers use more than this much
+# memory in total, or once it has captured this many pages.
+BROWSER_MAX_RSS_MB = int(os.getenv('BROWSER_MAX_RSS_MB', '2048'))
+BROWSER_MAX_PAGES = int(os.getenv('BROWSER_MAX_PAGES', '2000'))
+# Start a replacement in the background once a browser reaches this share
+# of either limit, so it is ready by the time the old one is recycled.
+PREWARM_FRACTION = float(os.getenv('PREWARM_FRACTION', '0.8'))
+# Always keep one standby browser launched and parked on the reader, so a
+# replacement for a crashed, killed or recycled browser is ready instantly.
+KEEP_SPARE = os.getenv('KEEP_SPARE', '1') == '1'
+
+
+def browser_rss(driver):
+    """Return the combined RSS in bytes of chromedriver's Chrome processes.
+
+    Returns None when psutil isn't installed or the processes are gone.
+    """
+    process = getattr(getattr(driver, "service", None), "process", None)
+    if psutil is None or process is None:
+        return None
+    try:
+        root = psutil.Process(process.pid)
+        total = 0
+        for child in root.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return total
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return None
+
+
+class DriverPool:
+    """Hands out browsers and recycles them before they grow too large.
+
+    `factory()` makes a new driver, `close(driver)` shuts one down
+    gracefully and `warm(driver, url)` gets a standby browser ready on the
+    reader. Memory is sampled between chapters by checkin().
+    """
+
+    def __init__(self, factory, close, warm=None, log=print,
+                 max_rss_mb=BROWSER_MAX_RSS_MB, max_pages=BROWSER_MAX_PAGES,
+                 keep_spare=KEEP_SPARE):
+        self.factory = factory
+        self.close_driver = close
+        self.warm = warm
+        self.warm_url = None
+        self.keep_spare = keep_spare
+        self.log = log
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.max_pages = max_pages
+        self.peak_rss = 0
+        self.recycles = {"memory": 0, "pages": 0}
+        self._spare = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    def _prepare(self, driver):
+        driver.pool_stats = {"pages": 0, "peak_rss": 0}
+        return driver
+
+    def _make_spare(self):
+        """Launch a browser and park it on the reader with settings applied."""
+        driver = self.factory()
+        if self.warm is not None and self.warm_url:
+            try:
+                self.warm(driver, self.warm_url)
+            except Exception as e:
+                print(f"Could not warm up spare browser: {e}")
+        return driver
+
+    def _start_spare(self):
+        with self._lock:
+            if self._spare is None:
+                print("Starting a spare browser in the background")
+                self._spare = self._executor.submit(self._make_spare)
+
+    def _take_spare(self):
+        with self._lock:
+            spare, self._spare = self._spare, None
+        if spare is None:
+            return None
+        try:
+            return spare.result()
+        except Exception as e:
+            print(f"Spare browser failed to start: {e}")
+            return None
+
+    def set_warm_url(self, url):
+        """Set the page standby browsers are parked on."""
+        self.warm_url = url
+
+    def acquire(self):
+        """Return a ready browser, using the spare if one is waiting.
+
+        With keep_spare, another standby starts launching right away.
+        """
+        driver = self._take_spare() or self.factory()
+        if self.keep_spare:
+            self._start_spare()
+        return self._prepare(driver)
+
+    def checkin(self, driver, pages=0):
+        """Record finished work and return the browser to use next.
+
+        The returned browser is a fresh one when the old one went over the
+        memory or page limit; the old one is closed in the background.
+        """
+        stats = getattr(driver, "pool_stats", None) or self._prepare(driver).pool_stats
+        stats["pages"] += pages
+        rss = browser_rss(driver)
+        if rss is not None:
+            stats["peak_rss"] = max(stats["peak_rss"], rss)
+            self.peak_rss = max(self.peak_rss, rss)
+
+        over_memory = rss is not None and rss > self.max_rss
+        over_pages = stats["pages"] >= self.max_pages
+        if not (over_memory or over_pages):
+            if ((rss is not None and rss >= self.max_rss * PREWARM_FRACTION)
+                    or stats["pages"] >= self.max_pages * PREWARM_FRACTION):
+                self._start_spare()
+            return driver
+
+        reason = "memory" if over_memory else "pages"
+        self.recycles[reason] += 1
+        self.log(f"Recycling browser after {stats['pages']} pages at "
+                 f"{(rss or 0) / 1e6:.0f} MB ({reason} limit)")
+        replacement = self.acquire()
+        self._executor.submit(self.close_driver, driver)
+        return replacement
+
+    def replace(self):
+        """Return a new browser for one that crashed or was killed."""
+        return self.acquire()
+
+    def report(self):
+        """Print peak memory and how often browsers were recycled."""
+        if psutil is None:
+            print("Browser memory: not sampled (install psutil)")
+        else:
+            print(f"Browser memory peak: {self.peak_rss / 1e6:.0f} MB")
+        print(f"Browsers recycled: {self.recycles['memory']} for memory, "
+              f"{self.recycles['pages']} for page count")
+
+    def close(self):
+        """Shut down the spare, if any, and wait for background closes."""
+        spare = self._take_spare()
+        if spare is not None:
+            self.close_driver(spare)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,128 @@
+import os
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Reusable Chrome user-data-dirs, one per pool slot, so the HTTP cache,
+# cookies and the reader's own settings survive between runs.
+PROFILE_ROOT = os.getenv('PROFILE_ROOT') or os.path.join(
+    os.path.expanduser("~"), ".manga_dl", "profiles")
+CACHE_SIZE_MB = int(os.getenv('CACHE_SIZE_MB', '512'))
+MAX_PROFILES = int(os.getenv('MAX_PROFILES', '16'))
+
+LOCK_FILE = "slot.lock"
+SETTINGS_FILE = "reader_settings.json"
+
+
+def _lock(handle):
+    """Take a non-blocking exclusive lock, raising OSError if it is held."""
+    if os.name == "nt":
+        import msvcrt
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _unlock(handle):
+    """Release a lock taken with _lock()."""
+    if os.name == "nt":
+        import msvcrt
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+class Profile:
+    """A locked profile directory owned by one browser instance."""
+
+    def __init__(self, slot, path, lock_handle):
+        self.slot = slot
+        self.path = path
+        self.user_data_dir = os.path.join(path, "chrome")
+        self.cache_dir = os.path.join(path, "cache")
+        self._lock_handle = lock_handle
+        self.settings = self._load_settings()
+
+    def _settings_path(self):
+        return os.path.join(self.path, SETTINGS_FILE)
+
+    def _load_settings(self):
+        try:
+            with open(self._settings_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_settings(self):
+        """Write the reader settings atomically next to the profile."""
+        tmp_path = self._settings_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.settings, f, indent=2)
+        os.replace(tmp_path, self._settings_path())
+
+    def chrome_arguments(self):
+        """Return the Chrome flags that point a browser at this profile."""
+        return [
+            f"--user-data-dir={self.user_data_dir}",
+            f"--disk-cache-dir={self.cache_dir}",
+            f"--disk-cache-size={CACHE_SIZE_MB * 1024 * 1024}",
+            "--no-first-run",
+            "--no-default-browser-check",
+        ]
+
+    def release(self):
+        """Unlock the slot so another worker can use it."""
+        if self._lock_handle is None:
+            return
+        try:
+            _unlock(self._lock_handle)
+        except OSError:
+            pass
+        self._lock_handle.close()
+        self._lock_handle = None
+
+
+def use_profile_root(path):
+    """Keep profiles under `path` from now on and return the previous root."""
+    global PROFILE_ROOT
+    previous, PROFILE_ROOT = PROFILE_ROOT, path
+    return previous
+
+
+def _try_acquire(slot):
+    """Lock the given slot and return its Profile, or None if it is busy."""
+    path = os.path.join(PROFILE_ROOT, f"slot-{slot:02d}")
+    os.makedirs(path, exist_ok=True)
+    handle = open(os.path.join(path, LOCK_FILE), "a+")
+    try:
+        _lock(handle)
+    except OSError:
+        handle.close()
+        return None
+    handle.seek(0)
+    handle.truncate()
+    handle.write(str(os.getpid()))
+    handle.flush()
+    return Profile(slot, path, handle)
+
+
+def acquire_profile(slot=0):
+    """Lock a profile slot, preferring `slot` and falling back to any free one.
+
+    The lock is held by an open file handle, so it is released by the OS if
+    the worker dies and never needs manual cleanup.
+    """
+    candidates = [slot] + [s for s in range(MAX_PROFILES) if s != slot]
+    for candidate in candidates:
+        profile = _try_acquire(candidate)
+        if profile is not None:
+            if candidate != slot:
+                print(f"Profile slot {slot} busy, using slot {candidate}")
+            return profile
+    raise RuntimeError(
+        f"All {MAX_PROFILES} browser profiles under {PROFILE_ROOT} are in use.")
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import threading
+import urllib.request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Remote WebDriver servers (Selenium Grid or standalone chromedriver) to run
+# browsers on, as comma-separated "url capacity" entries, e.g.
+# "http://box1:4444 4, http://box2:4444 2". Capacity defaults to 1. When
+# empty, browsers are started locally.
+REMOTE_WEBDRIVERS = os.getenv('REMOTE_WEBDRIVERS', '')
+# Seconds between health checks of an endpoint.
+ENDPOINT_CHECK_INTERVAL = float(os.getenv('ENDPOINT_CHECK_INTERVAL', '30'))
+# Seconds to wait for a free, healthy endpoint before giving up.
+ENDPOINT_WAIT = float(os.getenv('ENDPOINT_WAIT', '120'))
+
+
+def parse_endpoints(setting):
+    """Parse the REMOTE_WEBDRIVERS setting into (url, capacity) pairs."""
+    endpoints = []
+    for entry in setting.split(","):
+        parts = entry.split()
+        if not parts:
+            continue
+        capacity = int(parts[1]) if len(parts) > 1 else 1
+        endpoints.append((parts[0].rstrip("/"), max(1, capacity)))
+    return endpoints
+
+
+class Endpoint:
+    """One remote WebDriver server and the sessions running on it."""
+
+    def __init__(self, url, capacity):
+        self.url = url
+        self.capacity = capacity
+        self.active = 0
+        self.healthy = True
+        self.checked = 0.0
+        self.sessions = 0
+        self.failures = 0
+
+    def load(self):
+        return self.active / self.capacity
+
+
+def check_endpoint(url, timeout=5):
+    """Return True if the server's /status says it can take new sessions."""
+    try:
+        with urllib.request.urlopen(f"{url}/status", timeout=timeout) as response:
+            status = json.loads(response.read()).get("value", {})
+    except (OSError, ValueError):
+        return False
+    return bool(status.get("ready", True))
+
+
+class EndpointPool:
+    """Assigns new browser sessions to the least-loaded healthy endpoint."""
+
+    def __init__(self, endpoints, check_interval=ENDPOINT_CHECK_INTERVAL,
+                 wait=ENDPOINT_WAIT):
+        self.endpoints = [Endpoint(url, capacity) for url, capacity in endpoints]
+        self.check_interval = check_interval
+        self.wait = wait
+        self._changed = threading.Condition()
+
+    def _refresh_health(self):
+        """Re-check endpoints whose last health check is too old."""
+        now = time.time()
+        for endpoint in self.endpoints:
+            if now - endpoint.checked < self.check_interval:
+                continue
+            healthy = check_endpoint(endpoint.url)
+            with self._changed:
+                if healthy != endpoint.healthy:
+                    print(f"Remote WebDriver {endpoint.url} is "
+                          f"{'back up' if healthy else 'down'}")
+                endpoint.healthy = healthy
+                endpoint.checked = now
+
+    def acquire(self):
+        """Reserve a session slot on the least-loaded healthy endpoint.
+
+        Waits up to `wait` seconds for capacity to free up or an endpoint to
+        recover, then raises RuntimeError.
+        """
+        give_up = time.time() + self.wait
+        while True:
+            self._refresh_health()
+            with self._changed:
+                free = [endpoint for endpoint in self.endpoints
+                        if endpoint.healthy and endpoint.active < endpoint.capacity]
+                if free:
+                    endpoint = min(free, key=Endpoint.load)
+                    endpoint.active += 1
+                    endpoint.sessions += 1
+                    return endpoint
+                remaining = give_up - time.time()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        "No remote WebDriver endpoint has a free session: " + ", ".join(
+                            f"{endpoint.url} {endpoint.active}/{endpoint.capacity}"
+                            f"{'' if endpoint.healthy else ' (down)'}"
+                            for endpoint in self.endpoints))
+                self._changed.wait(min(remaining, self.check_interval))
+
+    def release(self, endpoint, failed=False):
+        """Free a session slot.
+
+        A failed session start marks the endpoint down until its next
+        health check, so the next session goes elsewhere.
+        """
+        with self._changed:
+            endpoint.active = max(0, endpoint.active - 1)
+            if failed:
+                endpoint.failures += 1
+                endpoint.healthy = False
+                endpoint.checked = time.time()
+            self._changed.notify_all()
+
+    def report(self):
+        """Print sessions started and failures per endpoint."""
+        for endpoint in self.endpoints:
+            print(f"Remote WebDriver {endpoint.url}: {endpoint.sessions} sessions, "
+                  f"{endpoint.failures} failed starts, {endpoint.active}/"
+                  f"{endpoint.capacity} in use")
+
+
+_endpoint_pool = None
+_endpoint_pool_lock = threading.Lock()
+
+
+def get_endpoint_pool(setting=REMOTE_WEBDRIVERS):
+    """Return the process-wide endpoint pool, or None to run browsers locally."""
+    global _endpoint_pool
+    endpoints = parse_endpoints(setting)
+    if not endpoints:
+        return None
+    with _endpoint_pool_lock:
+        if _endpoint_pool is None:
+            _endpoint_pool = EndpointPool(endpoints)
+        return _endpoint_pool
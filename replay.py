@@ -0,0 +1,492 @@
+import os
+import re
+import json
+import time
+import base64
+import random
+import hashlib
+import zipfile
+import argparse
+import tempfile
+import threading
+import contextlib
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from profiles import use_profile_root
+from strategies import StrategyRegistry, use_registry
+from timeouts import TimeoutTuner, get_tuner, use_tuner
+
+# Largest amount of response bodies Chrome keeps for the recorder to fetch.
+RECORD_BUFFER_MB = int(os.getenv('RECORD_BUFFER_MB', '200'))
+REPLAY_PORT = int(os.getenv('REPLAY_PORT', '8790'))
+
+# Response headers worth keeping. Everything else (cookies, caching,
+# security policies) is dropped or replaced on replay.
+KEPT_HEADERS = ("content-type", "location")
+TEXT_TYPES = ("text/", "javascript", "json", "xml", "css")
+
+
+def _url_key(url):
+    """Match recorded and replayed URLs regardless of scheme and fragment."""
+    parsed = urlparse(url)
+    key = f"{parsed.netloc}{parsed.path or '/'}"
+    return f"{key}?{parsed.query}" if parsed.query else key
+
+
+class Recorder:
+    """Collects the responses a browser receives through its performance log.
+
+    The browser must be started with create_driver(record_network=True).
+    Call collect() often: Chrome only keeps response bodies for a while.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.entries = {}
+        self.bodies = {}
+        self.missed = 0
+        self._requests = {}
+        driver.execute_cdp_cmd("Network.enable", {
+            "maxTotalBufferSize": RECORD_BUFFER_MB * 1024 * 1024,
+            "maxResourceBufferSize": RECORD_BUFFER_MB * 1024 * 1024 // 4,
+        })
+
+    def _add(self, method, url, status, headers, body=None):
+        if not url.startswith(("http://", "https://")):
+            return
+        headers = {name.lower(): value for name, value in headers.items()
+                   if name.lower() in KEPT_HEADERS}
+        digest = None
+        if body is not None:
+            digest = hashlib.sha256(body).hexdigest()
+            self.bodies[digest] = body
+        self.entries[(method, _url_key(url))] = {
+            "method": method, "url": url, "status": status,
+            "headers": headers, "body": digest,
+        }
+
+    def collect(self):
+        """Drain the performance log and fetch the bodies it points at."""
+        finished = []
+        for entry in self.driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            params = message.get("params", {})
+            if message["method"] == "Network.requestWillBeSent":
+                redirect = params.get("redirectResponse")
+                if redirect:
+                    self._add(params["request"]["method"], redirect["url"],
+                              redirect["status"], redirect.get("headers", {}))
+                self._requests[params["requestId"]] = params["request"]["method"]
+            elif message["method"] == "Network.responseReceived":
+                self._requests[params["requestId"]] = (
+                    self._requests.get(params["requestId"], "GET"), params["response"])
+            elif message["method"] == "Network.loadingFinished":
+                finished.append(params["requestId"])
+
+        for request_id in finished:
+            request = self._requests.pop(request_id, None)
+            if not isinstance(request, tuple):
+                continue
+            method, response = request
+            try:
+                result = self.driver.execute_cdp_cmd(
+                    "Network.getResponseBody", {"requestId": request_id})
+            except Exception:
+                self.missed += 1
+                continue
+            body = result["body"]
+            body = (base64.b64decode(body) if result.get("base64Encoded")
+                    else body.encode("utf-8"))
+            self._add(method, response["url"], response["status"],
+                      response.get("headers", {}), body)
+
+    def save(self, path, start_url):
+        """Write everything recorded so far to a fixture archive."""
+        self.collect()
+        index = {
+            "start_url": start_url,
+            "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "entries": list(self.entries.values()),
+        }
+        tmp_path = path + ".tmp"
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("index.json", json.dumps(index, indent=1))
+            for digest, body in self.bodies.items():
+                archive.writestr(f"bodies/{digest}", body)
+        os.replace(tmp_path, path)
+        size = sum(len(body) for body in self.bodies.values())
+        print(f"Recorded {len(self.entries)} responses ({size / 1024 / 1024:.1f} MB) "
+              f"to {path}, {self.missed} bodies no longer available")
+
+
+class RecordingSink:
+    """Sink wrapper that collects the browser's responses after every page."""
+
+    def __init__(self, inner, recorder):
+        self.inner = inner
+        self.recorder = recorder
+        self.path = inner.path
+        self.ordered = getattr(inner, "ordered", True)
+
+    def has_page(self, page_number):
+        return self.inner.has_page(page_number)
+
+    def write_page(self, page_number, data):
+        self.recorder.collect()
+        return self.inner.write_page(page_number, data)
+
+    def close(self):
+        self.inner.close()
+
+    def abort(self):
+        self.inner.abort()
+
+
+class FixtureArchive:
+    """A recorded chapter, looked up by URL."""
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as archive:
+            index = json.loads(archive.read("index.json"))
+            self.bodies = {name[len("bodies/"):]: archive.read(name)
+                           for name in archive.namelist() if name.startswith("bodies/")}
+        self.start_url = index["start_url"]
+        self.host = urlparse(self.start_url).netloc
+        self.entries = {}
+        self.by_path = {}
+        for entry in index["entries"]:
+            key = _url_key(entry["url"])
+            self.entries[(entry["method"], key)] = entry
+            # Fallback for cache-busting query strings and for root-relative
+            # URLs of other hosts that end up on the replay server's root
+            parsed = urlparse(entry["url"])
+            self.by_path.setdefault((entry["method"], parsed.netloc, parsed.path), entry)
+            self.by_path.setdefault((entry["method"], None, parsed.path), entry)
+        self.hosts = sorted({urlparse(entry["url"]).netloc for entry in index["entries"]})
+
+    def find(self, method, host, path_and_query):
+        key = f"{host}{path_and_query}"
+        entry = self.entries.get((method, key))
+        if entry is None:
+            path = urlparse(path_and_query).path
+            entry = (self.by_path.get((method, host, path))
+                     or self.by_path.get((method, None, path)))
+        return entry
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serve recorded responses, with the configured latency and failures.
+
+    The recorded site is served at the root; other recorded hosts (image
+    CDNs and the like) under /_hosts/<host>/.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._replay("GET")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self._replay("POST")
+
+    def _replay(self, method):
+        server = self.server
+        archive = server.archive
+        host, path = archive.host, self.path
+        match = re.match(r"/_hosts/([^/]+)(/.*)?$", self.path)
+        if match:
+            host, path = match.group(1), match.group(2) or "/"
+
+        fault = server.faults.draw(f"{host}{path}")
+        if fault == "fail":
+            return self._send(503, b"Injected failure", "text/plain")
+        entry = archive.find(method, host, path)
+        if entry is None:
+            server.count("missing", f"{method} {host}{path}")
+            return self._send(404, b"Not recorded", "text/plain")
+
+        body = archive.bodies.get(entry["body"], b"") if entry["body"] else b""
+        content_type = entry["headers"].get("content-type", "application/octet-stream")
+        if any(kind in content_type for kind in TEXT_TYPES):
+            body = server.rewrite(body)
+        headers = {}
+        if "location" in entry["headers"]:
+            headers["Location"] = server.rewrite(
+                entry["headers"]["location"].encode("utf-8")).decode("utf-8")
+        server.count("served")
+        if fault == "stall":
+            # Send the headers and a little of the body, then hang
+            self._send(entry["status"], body, content_type, headers, stall=True)
+            return
+        self._send(entry["status"], body, content_type, headers)
+
+    def _send(self, status, body, content_type, headers=None, stall=False):
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if stall:
+                self.wfile.write(body[:len(body) // 4])
+                self.wfile.flush()
+                time.sleep(self.server.faults.stall_seconds)
+                self.wfile.write(body[len(body) // 4:])
+            else:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Faults:
+    """Latency, failures and stalls injected into matching replayed requests.
+
+    Decisions come from a seeded random generator, so the same seed gives
+    the same faults in the same request order.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, fail_rate=0.0, stall_rate=0.0,
+                 stall_seconds=60.0, match=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.match = re.compile(match) if match else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.injected = {"fail": 0, "stall": 0}
+
+    def draw(self, url):
+        """Sleep the injected latency and return "fail", "stall" or None."""
+        if self.match is not None and not self.match.search(url):
+            return None
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            roll = self._random.random()
+            fault = None
+            if roll < self.fail_rate:
+                fault = "fail"
+            elif roll < self.fail_rate + self.stall_rate:
+                fault = "stall"
+            if fault:
+                self.injected[fault] += 1
+        if delay > 0:
+            time.sleep(delay)
+        return fault
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Serves a fixture archive on localhost."""
+
+    daemon_threads = True
+
+    def __init__(self, archive, faults=None, port=REPLAY_PORT):
+        super().__init__(("127.0.0.1", port), ReplayHandler)
+        self.archive = archive
+        self.faults = faults or Faults()
+        self.origin = f"http://127.0.0.1:{self.server_address[1]}"
+        self.counts = {"served": 0, "missing": 0}
+        self.missing = []
+        self._lock = threading.Lock()
+        hosts = "|".join(re.escape(host) for host in archive.hosts)
+        # Absolute and protocol-relative links to recorded hosts, also in
+        # JSON where slashes are escaped
+        self._links = re.compile(rf"(?:https?:)?(\\?/\\?/)({hosts})(?![\w.-])".encode("utf-8"))
+        self._rewritten = {}
+
+    def rewrite(self, body):
+        """Point links to recorded hosts at this server."""
+        if body in self._rewritten:
+            return self._rewritten[body]
+
+        def local(match):
+            host = match.group(2).decode("utf-8")
+            target = self.origin if host == self.archive.host else f"{self.origin}/_hosts/{host}"
+            if b"\\" in match.group(1):
+                target = target.replace("/", "\\/")
+            return target.encode("utf-8")
+
+        rewritten = self._links.sub(local, body)
+        self._rewritten[body] = rewritten
+        return rewritten
+
+    def local_url(self, url):
+        return self.rewrite(url.encode("utf-8")).decode("utf-8")
+
+    def count(self, name, url=None):
+        with self._lock:
+            self.counts[name] += 1
+            if url is not None and len(self.missing) < 20:
+                self.missing.append(url)
+
+    def start(self):
+        """Serve from a background thread and return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def report(self):
+        print(f"Replay: {self.counts['served']} responses served, "
+              f"{self.counts['missing']} not recorded, {self.faults.injected['fail']} "
+              f"failures and {self.faults.injected['stall']} stalls injected")
+        for url in self.missing:
+            print(f"  not recorded: {url}")
+
+
+def record(url, path, width, height):
+    """Download one chapter from the live site, recording everything it loads."""
+    from main import create_driver, download_chapter, extract_url_info, quit_driver
+    from sinks import open_sink
+
+    content_type, number, _ = extract_url_info(url)
+    driver = create_driver(width, height, record_network=True)
+    try:
+        recorder = Recorder(driver)
+        with tempfile.TemporaryDirectory() as folder:
+            sink = RecordingSink(open_sink(folder, content_type, number,
+                                           output_format="folder"), recorder)
+            try:
+                download_chapter(driver, url, folder, content_type, number, tabs=1, sink=sink)
+            finally:
+                sink.close()
+            recorder.save(path, url)
+    finally:
+        quit_driver(driver)
+
+
+@contextlib.contextmanager
+def isolated_state():
+    """Use fresh timeouts, selector winners and browser profiles inside the block.
+
+    They start from the defaults and are thrown away afterwards, so measured
+    runs neither depend on nor change what normal downloads have learned.
+    """
+    with tempfile.TemporaryDirectory() as profile_root:
+        tuner = use_tuner(TimeoutTuner(path=None))
+        registry = use_registry(StrategyRegistry(path=None))
+        root = use_profile_root(profile_root)
+        try:
+            yield
+        finally:
+            use_tuner(tuner)
+            use_registry(registry)
+            use_profile_root(root)
+
+
+def bench(path, faults, runs, width, height, port=0):
+    """Download a recorded chapter from the replay server `runs` times."""
+    with isolated_state():
+        return _bench(path, faults, runs, width, height, port)
+
+
+def _bench(path, faults, runs, width, height, port):
+    from main import create_driver, download_chapter, extract_url_info, quit_driver
+    from sinks import ProgressSink, open_sink
+
+    server = ReplayServer(FixtureArchive(path), faults, port).start()
+    url = server.local_url(server.archive.start_url)
+    content_type, number, _ = extract_url_info(url)
+    driver = create_driver(width, height)
+    timings = []
+    try:
+        for run in range(1, runs + 1):
+            with tempfile.TemporaryDirectory() as folder:
+                sink = ProgressSink(open_sink(folder, content_type, number,
+                                              output_format="folder"))
+                started = time.time()
+                try:
+                    download_chapter(driver, url, folder, content_type, number,
+                                     tabs=1, sink=sink)
+                except Exception as e:
+                    print(f"Run {run}: failed after {time.time() - started:.1f}s: {e}")
+                    continue
+                finally:
+                    sink.close()
+                seconds = time.time() - started
+                pages = len(sink.done)
+            timings.append(seconds)
+            print(f"Run {run}: {pages} pages in {seconds:.1f}s"
+                  + (f" ({seconds / pages:.2f}s per page)" if pages else ""))
+    finally:
+        quit_driver(driver)
+        server.report()
+        server.shutdown()
+        server.server_close()
+    if timings:
+        timings.sort()
+        print(f"Fastest {timings[0]:.1f}s, median {timings[len(timings) // 2]:.1f}s, "
+              f"slowest {timings[-1]:.1f}s over {len(timings)} runs")
+    get_tuner().report()
+    return timings
+
+
+def _add_fault_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0,
+                        help="share of responses that hang part way through")
+    parser.add_argument("--stall-seconds", type=float, default=60.0)
+    parser.add_argument("--match", help="only inject into URLs matching this regex")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def _faults(args):
+    return Faults(args.latency, args.jitter, args.fail_rate, args.stall_rate,
+                  args.stall_seconds, args.match, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Record a chapter from the site and replay it offline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recording = commands.add_parser("record", help="download a chapter and record it")
+    recording.add_argument("url")
+    recording.add_argument("archive", help="fixture archive to write, e.g. chapter-1.zip")
+    recording.add_argument("--width", type=int, default=1450)
+    recording.add_argument("--height", type=int, default=1934)
+
+    serving = commands.add_parser("serve", help="serve a fixture archive until interrupted")
+    serving.add_argument("archive")
+    serving.add_argument("--port", type=int, default=REPLAY_PORT)
+    _add_fault_arguments(serving)
+
+    benching = commands.add_parser("bench", help="time downloads of a fixture archive")
+    benching.add_argument("archive")
+    benching.add_argument("--runs", type=int, default=3)
+    benching.add_argument("--width", type=int, default=1450)
+    benching.add_argument("--height", type=int, default=1934)
+    _add_fault_arguments(benching)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.url, args.archive, args.width, args.height)
+    elif args.command == "serve":
+        server = ReplayServer(FixtureArchive(args.archive), _faults(args), args.port)
+        print(f"Replaying {args.archive}: {server.local_url(server.archive.start_url)}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.report()
+            server.server_close()
+    else:
+        bench(args.archive, _faults(args), args.runs, args.width, args.height)
+
+
+if __name__ == "__main__":
+    main()
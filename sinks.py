@@ -0,0 +1,433 @@
+import os
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from export import WRITERS
+from imaging import AUTOCROP, autocrop, dhash, imaging_available
+from pagestore import get_page_store
+from tracing import span
+
+# Where captured pages end up: "folder" keeps the classic chapter-NNN/NNN.jpg
+# layout, "cbz" streams every page into one chapter-NNN.cbz archive and
+# "pdf"/"epub" build an e-reader file page by page.
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'folder').lower()
+# Threads that post-process pages (crop, re-encode) off the capture loop,
+# and how many pages each task handles.
+ENCODE_WORKERS = int(os.getenv('ENCODE_WORKERS', '2'))
+ENCODE_BATCH = int(os.getenv('ENCODE_BATCH', '4'))
+
+
+class ChapterStopped(Exception):
+    """Raised by a ProgressSink callback to stop the chapter; never retried."""
+
+
+class FolderSink:
+    """Write each page as its own file inside a chapter folder.
+
+    With a page store, pages are stored once by content and hard linked in.
+    """
+
+    # Pages can arrive in any order.
+    ordered = False
+
+    def __init__(self, folder, store=None):
+        self.path = folder
+        self.store = store
+        os.makedirs(folder, exist_ok=True)
+
+    def has_page(self, page_number):
+        return os.path.exists(os.path.join(self.path, f"{page_number:03d}.jpg"))
+
+    def write_page(self, page_number, data):
+        filename = os.path.join(self.path, f"{page_number:03d}.jpg")
+        if self.store is not None:
+            return self.store.store_page(data, filename)
+        # The old file may be a hard link into a page store, shared with other
+        # chapters, so it is replaced rather than overwritten in place.
+        tmp_path = filename + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filename)
+        return filename
+
+    def close(self):
+        pass
+
+    def abort(self):
+        # Pages already on disk are kept so a re-run can see what was captured,
+        # but don't leave an empty folder behind for a chapter that never started.
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+
+class CbzSink:
+    """Stream pages straight into a CBZ, finalised atomically on close()."""
+
+    ordered = True
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = metadata or {}
+        self.page_count = 0
+        self._tmp_path = path + ".part"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Pages are already compressed images, so deflating them only costs CPU.
+        self._archive = zipfile.ZipFile(
+            self._tmp_path, "w", compression=zipfile.ZIP_STORED)
+
+    def write_page(self, page_number, data):
+        name = f"{page_number:03d}.png"
+        self._archive.writestr(name, data)
+        self.page_count += 1
+        return f"{self.path}:{name}"
+
+    def close(self):
+        """Add ComicInfo.xml and move the finished archive into place."""
+        self._archive.writestr("ComicInfo.xml", comic_info_xml(
+            self.metadata, self.page_count))
+        self._archive.close()
+        with open(self._tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(self._tmp_path, self.path)
+        print(f"Archive written: {self.path} ({self.page_count} pages)")
+
+    def abort(self):
+        """Drop the partial archive so no truncated CBZ is left behind."""
+        self._archive.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def _transform_batch(transform, batch):
+    """Apply a transform to a batch of pages, keeping originals on failure."""
+    results = []
+    for page_number, data in batch:
+        try:
+            with span("encode", page=page_number):
+                data = transform(data)
+        except Exception as e:
+            print(f"Error processing page {page_number:03d}, keeping original: {e}")
+        results.append((page_number, data))
+    return results
+
+
+class PipelineSink:
+    """Transform pages in batches on a thread pool, then write them in order.
+
+    The capture loop only queues pages; the wrapped sink still sees a single
+    writer calling it in page order.
+    """
+
+    def __init__(self, inner, transform, workers=ENCODE_WORKERS,
+                 batch_size=ENCODE_BATCH):
+        self.inner = inner
+        self.path = inner.path
+        self.ordered = getattr(inner, "ordered", True)
+        self.transform = transform
+        self.batch_size = max(1, batch_size)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._batch = []
+        self._pending = deque()
+
+    def _submit(self):
+        if self._batch:
+            self._pending.append(self._pool.submit(
+                _transform_batch, self.transform, self._batch))
+            self._batch = []
+
+    def _drain(self, block):
+        while self._pending and (block or self._pending[0].done()):
+            for page_number, data in self._pending.popleft().result():
+                self.inner.write_page(page_number, data)
+
+    def has_page(self, page_number):
+        has_page = getattr(self.inner, "has_page", None)
+        return has_page is not None and has_page(page_number)
+
+    def write_page(self, page_number, data):
+        self._batch.append((page_number, data))
+        if len(self._batch) >= self.batch_size:
+            self._submit()
+        self._drain(block=False)
+        return f"{self.path} (page {page_number:03d} queued)"
+
+    def close(self):
+        self._submit()
+        try:
+            self._drain(block=True)
+        finally:
+            self._pool.shutdown()
+        self.inner.close()
+
+    def abort(self):
+        self._pool.shutdown(cancel_futures=True)
+        self._pending.clear()
+        self.inner.abort()
+
+
+class ReorderSink:
+    """Accept pages in any order and pass them on in page order.
+
+    Used when several tabs capture different page ranges of one chapter.
+    Pages that arrive early are parked in a temporary folder next to the
+    output, so memory use doesn't grow with the size of the gap.
+    """
+
+    ordered = False
+
+    def __init__(self, inner, first_page=1):
+        self.inner = inner
+        self.path = inner.path
+        self._next_page = first_page
+        self._parked = {}
+        parent = os.path.dirname(os.path.abspath(inner.path))
+        os.makedirs(parent, exist_ok=True)
+        self._spill_dir = tempfile.mkdtemp(prefix=".reorder-", dir=parent)
+
+    def _read_parked(self, page_number):
+        spill_path = self._parked.pop(page_number)
+        with open(spill_path, "rb") as f:
+            data = f.read()
+        os.remove(spill_path)
+        return data
+
+    def _flush(self):
+        """Write out parked pages that are now next in line."""
+        while self._next_page in self._parked:
+            self.inner.write_page(
+                self._next_page, self._read_parked(self._next_page))
+            self._next_page += 1
+
+    def write_page(self, page_number, data):
+        if page_number != self._next_page:
+            spill_path = os.path.join(self._spill_dir, f"{page_number:05d}")
+            with open(spill_path, "wb") as f:
+                f.write(data)
+            self._parked[page_number] = spill_path
+            return f"{self.path} (page {page_number:03d} waiting for earlier pages)"
+
+        saved_as = self.inner.write_page(page_number, data)
+        self._next_page += 1
+        self._flush()
+        return saved_as
+
+    def finish(self):
+        """Write out everything still parked without closing the inner sink."""
+        # Anything still parked is behind a missing page; write it in order.
+        for page_number in sorted(self._parked):
+            self.inner.write_page(page_number, self._read_parked(page_number))
+        self.release()
+
+    def release(self):
+        """Drop parked pages without touching the inner sink."""
+        self._parked.clear()
+        shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+    def close(self):
+        self.finish()
+        self.inner.close()
+
+    def abort(self):
+        self.release()
+        self.inner.abort()
+
+
+class ProgressSink:
+    """Pass pages through and remember which ones were written.
+
+    Lets a chapter that had to restart its browser resume from the first
+    page that is still missing. `saved` are pages from an earlier run; only
+    those the wrapped sink can confirm it still has (see has_page()) count
+    as done. `before_page(page_number)` is called before each write and
+    may raise ChapterStopped; `on_page(page_number)` is called after it.
+    """
+
+    def __init__(self, inner, saved=(), on_page=None, before_page=None):
+        self.inner = inner
+        self.path = inner.path
+        self.ordered = getattr(inner, "ordered", True)
+        self.on_page = on_page
+        self.before_page = before_page
+        has_page = getattr(inner, "has_page", None)
+        self.done = {page_number for page_number in saved
+                     if has_page is not None and has_page(page_number)}
+
+    def write_page(self, page_number, data):
+        if self.before_page is not None:
+            self.before_page(page_number)
+        saved_as = self.inner.write_page(page_number, data)
+        self.done.add(page_number)
+        if self.on_page is not None:
+            self.on_page(page_number)
+        return saved_as
+
+    def next_missing(self, first_page=1):
+        """Return the first page number that hasn't been written yet."""
+        page_number = first_page
+        while page_number in self.done:
+            page_number += 1
+        return page_number
+
+    def close(self):
+        self.inner.close()
+
+    def abort(self):
+        self.inner.abort()
+
+
+def manifest_path(output_path):
+    """Return where the manifest of a chapter's output is kept."""
+    return output_path.rstrip("/\\") + ".manifest.json"
+
+
+def load_manifest(output_path):
+    """Return the saved manifest for a chapter's output, or None."""
+    try:
+        with open(manifest_path(output_path), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ManifestSink:
+    """Record a fingerprint of every page written, for verify.py.
+
+    Each page gets the perceptual hash of the captured frame, plus the image
+    URL the reader showed when one is known. Both are normally handed over
+    with note_source(), so the frame isn't decoded again here. The manifest
+    is saved next to the output on close, and on abort for chapter folders
+    (whose pages are kept), merged with any earlier one for the same chapter.
+    """
+
+    def __init__(self, inner, url):
+        self.inner = inner
+        self.path = inner.path
+        self.ordered = getattr(inner, "ordered", True)
+        self.manifest = load_manifest(inner.path) or {"pages": {}}
+        self.manifest["url"] = url
+        self.sources = {}
+        self.hashes = {}
+
+    def has_page(self, page_number):
+        has_page = getattr(self.inner, "has_page", None)
+        return has_page is not None and has_page(page_number)
+
+    def write_page(self, page_number, data):
+        saved_as = self.inner.write_page(page_number, data)
+        page_hash = self.hashes.pop(page_number, None)
+        if page_hash is None and imaging_available():
+            try:
+                page_hash = dhash(data)
+            except Exception:
+                pass
+        self.manifest["pages"][str(page_number)] = {
+            "dhash": f"{page_hash:016x}" if page_hash is not None else None,
+            "source": self.sources.pop(page_number, None),
+        }
+        return saved_as
+
+    def set_page_count(self, page_count):
+        self.manifest["page_count"] = page_count
+
+    def _save(self):
+        if not self.manifest["pages"]:
+            return
+        self.manifest["updated"] = time.time()
+        path = manifest_path(self.path)
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=1, sort_keys=True)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Could not save page manifest {path}: {e}")
+
+    def close(self):
+        self.inner.close()
+        self._save()
+
+    def abort(self):
+        self.inner.abort()
+        # An aborted archive is deleted, so only a folder's pages remain
+        if os.path.isdir(self.path):
+            self._save()
+
+
+def note_source(sink, page_number, source, page_hash=None):
+    """Tell the ManifestSink under `sink`, if any, which image URL a page showed.
+
+    `page_hash` is the frame's perceptual hash when the caller already has
+    it. Call before writing the page.
+    """
+    while sink is not None:
+        if isinstance(sink, ManifestSink):
+            if source:
+                sink.sources[page_number] = source
+            if page_hash is not None:
+                sink.hashes[page_number] = page_hash
+            return
+        sink = getattr(sink, "inner", None)
+
+
+def set_page_count(sink, page_count):
+    """Record the chapter's page count in the ManifestSink under `sink`, if any."""
+    while sink is not None:
+        if isinstance(sink, ManifestSink):
+            sink.set_page_count(page_count)
+            return
+        sink = getattr(sink, "inner", None)
+
+
+def comic_info_xml(metadata, page_count):
+    """Build a ComicInfo.xml document from chapter metadata."""
+    fields = [
+        ("Series", metadata.get("series")),
+        ("Number", metadata.get("number")),
+        ("Volume", metadata.get("volume")),
+        ("Title", metadata.get("title")),
+        ("Web", metadata.get("url")),
+        ("LanguageISO", metadata.get("language")),
+        ("PageCount", page_count),
+        ("Manga", "Yes"),
+    ]
+    lines = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<ComicInfo xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema">',
+    ]
+    for tag, value in fields:
+        if value is not None and value != "":
+            lines.append(f"  <{tag}>{escape(str(value))}</{tag}>")
+    lines.append("</ComicInfo>")
+    return "\n".join(lines) + "\n"
+
+
+def open_sink(folder, content_type, number, metadata=None,
+              output_format=OUTPUT_FORMAT):
+    """Create the output sink for one chapter or volume."""
+    name = f"{content_type.lower()}-{int(number):03d}"
+    if output_format == "cbz":
+        sink = CbzSink(os.path.join(folder, f"{name}.cbz"), metadata)
+    elif output_format in WRITERS:
+        sink = WRITERS[output_format](
+            os.path.join(folder, f"{name}.{output_format}"), metadata)
+    elif output_format == "folder":
+        sink = FolderSink(os.path.join(folder, name), get_page_store(folder))
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+    if AUTOCROP:
+        if imaging_available():
+            return PipelineSink(sink, autocrop)
+        print("AUTOCROP is on but NumPy/Pillow are not installed, skipping crop.")
+    return sink
@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Remembers which selector worked for each site and page layout, so the
+# next lookup tries the last winner first instead of paying for a miss.
+STRATEGY_CACHE_PATH = os.getenv('STRATEGY_CACHE_PATH') or os.path.join(
+    os.path.expanduser("~"), ".manga_dl", "strategies.json")
+
+# Classes of the reader's navigation elements, used to tell layouts apart.
+# Page slides are left out (their number differs per chapter) and so are
+# classes that only reflect state, like the active slide or a disabled
+# button; each distinct element kind counts once.
+LAYOUT_FINGERPRINT_JS = """
+var state = /^(active|current|selected|disabled|hidden|show|showing|loading|loaded)$/;
+var seen = {};
+var nodes = document.querySelectorAll('body > *, .navi-buttons, [class*="hoz-"]');
+for (var i = 0; i < nodes.length && i < 200; i++) {
+    var name = typeof nodes[i].className === 'string' ? nodes[i].className : '';
+    var classes = name.split(/\\s+/).filter(function (c) { return c && !state.test(c); });
+    seen[nodes[i].tagName + '.' + classes.sort().join('.')] = true;
+}
+return Object.keys(seen).sort().join('|');
+"""
+
+
+def layout_fingerprint(driver):
+    """Return a short hash of the page's navigation structure.
+
+    Worked out once per page load and kept on the driver; navigation resets
+    it with forget_layout().
+    """
+    fingerprint = getattr(driver, "layout_fingerprint", None)
+    if fingerprint is not None:
+        return fingerprint
+    try:
+        layout = driver.execute_script(LAYOUT_FINGERPRINT_JS) or ""
+    except Exception:
+        layout = ""
+    fingerprint = hashlib.sha1(layout.encode("utf-8")).hexdigest()[:12]
+    if layout:
+        driver.layout_fingerprint = fingerprint
+    return fingerprint
+
+
+def forget_layout(driver):
+    """Make the next layout_fingerprint() call look at the page again."""
+    driver.layout_fingerprint = None
+
+
+class StrategyRegistry:
+    """Per site and layout, the selector strategy that last succeeded.
+
+    With `path` None nothing is loaded or saved.
+    """
+
+    def __init__(self, path=STRATEGY_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._winners = self._load()
+        # Per operation: lookups, misses and seconds spent on failed strategies.
+        self.stats = {}
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._winners, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, site, fingerprint, operation):
+        return f"{site} {fingerprint} {operation}"
+
+    def order(self, site, fingerprint, operation, strategies):
+        """Return strategies with the last winner for this layout first.
+
+        Falls back to the winner on any layout of the same site, then the
+        declared order.
+        """
+        with self._lock:
+            winner = self._winners.get(self._key(site, fingerprint, operation))
+            if winner is None:
+                winner = self._winners.get(self._key(site, "*", operation))
+        names = [strategy[0] for strategy in strategies]
+        if winner not in names:
+            return list(strategies)
+        return sorted(strategies, key=lambda strategy: strategy[0] != winner)
+
+    def record(self, site, fingerprint, operation, winner, missed, wasted):
+        """Record a lookup: the winning strategy (or None), misses and time lost."""
+        with self._lock:
+            stats = self.stats.setdefault(
+                operation, {"lookups": 0, "misses": 0, "fallback_wait": 0.0, "failures": 0})
+            stats["lookups"] += 1
+            stats["misses"] += missed
+            stats["fallback_wait"] += wasted
+            if winner is None:
+                stats["failures"] += 1
+                return
+            changed = False
+            for key in (self._key(site, fingerprint, operation),
+                        self._key(site, "*", operation)):
+                if self._winners.get(key) != winner:
+                    self._winners[key] = winner
+                    changed = True
+            if changed and self.path:
+                try:
+                    self._save()
+                except OSError as e:
+                    print(f"Could not save selector strategies: {e}")
+
+    def report(self):
+        """Print selector misses and time spent on fallbacks per operation."""
+        with self._lock:
+            for operation, stats in sorted(self.stats.items()):
+                print(f"Selector '{operation}': {stats['lookups']} lookups, "
+                      f"{stats['misses']} misses, {stats['failures']} failures, "
+                      f"{stats['fallback_wait']:.1f}s lost to fallbacks")
+
+
+_registry = None
+
+
+def get_registry():
+    """Return the process-wide strategy registry."""
+    global _registry
+    if _registry is None:
+        _registry = StrategyRegistry()
+    return _registry
+
+
+def use_registry(registry):
+    """Make `registry` the process-wide registry and return the previous one."""
+    global _registry
+    previous, _registry = _registry, registry
+    return previous
@@ -0,0 +1,192 @@
+import os
+import json
+import math
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Waits are set from how long each kind of operation actually took lately:
+# the TIMEOUT_PERCENTILE of recent latencies times TIMEOUT_HEADROOM, kept
+# within the operation's bounds. Set ADAPTIVE_TIMEOUTS=0 to always use the
+# defaults below.
+ADAPTIVE_TIMEOUTS = os.getenv('ADAPTIVE_TIMEOUTS', '1') == '1'
+TIMEOUT_PERCENTILE = float(os.getenv('TIMEOUT_PERCENTILE', '0.99'))
+TIMEOUT_HEADROOM = float(os.getenv('TIMEOUT_HEADROOM', '1.5'))
+# Samples needed before an operation's timeout moves off its default.
+TIMEOUT_MIN_SAMPLES = int(os.getenv('TIMEOUT_MIN_SAMPLES', '20'))
+# Weight kept by older samples at each new one, so the last few hundred
+# operations dominate and the timeouts follow the site's current speed.
+TIMEOUT_DECAY = float(os.getenv('TIMEOUT_DECAY', '0.995'))
+TIMEOUT_STATS_PATH = os.getenv('TIMEOUT_STATS_PATH') or os.path.join(
+    os.path.expanduser("~"), ".manga_dl", "timeouts.json")
+# Starting wait for the reader to show the next page after clicking Next.
+PAGE_ADVANCE_TIMEOUT = float(os.getenv('PAGE_ADVANCE_TIMEOUT', '5'))
+
+# Per operation: (default, lower bound, upper bound) in seconds. The
+# defaults are the waits that used to be hard-coded.
+TIMEOUT_BOUNDS = {
+    "element": (2, 0.5, 10),          # Setup buttons like 'Horizontal Follow'
+    "total_pages": (2, 0.5, 10),      # Page count in the reader header
+    "next_button": (5, 1, 15),        # 'Next' arrow after a capture
+    "step_button": (5, 1, 15),        # Next/Prev while stepping to a page
+    "reader": (15, 2, 30),            # Active page container after a load
+    "page_identified": (2, 0.5, 10),  # Reader or 404 marker after navigation
+    "page_advance": (PAGE_ADVANCE_TIMEOUT, 1, 15),  # Reader showing the next page
+    "page_jump": (5, 1, 15),          # Reader arriving on a page jumped to
+}
+
+# Histogram buckets grow by 15% from 10 ms, covering up to about 2 minutes.
+_BUCKET_BASE = 0.01
+_BUCKET_GROWTH = 1.15
+_BUCKETS = 68
+
+
+def _bucket(seconds):
+    if seconds <= _BUCKET_BASE:
+        return 0
+    index = int(math.log(seconds / _BUCKET_BASE, _BUCKET_GROWTH)) + 1
+    return min(index, _BUCKETS - 1)
+
+
+def _bucket_upper(index):
+    return _BUCKET_BASE * _BUCKET_GROWTH ** index
+
+
+class LatencyTracker:
+    """Streaming latency percentiles for one operation.
+
+    Samples go into log-spaced buckets whose weights decay, so memory and
+    update cost are fixed and old behaviour fades out.
+    """
+
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts and len(counts) == _BUCKETS else [0.0] * _BUCKETS
+        self.samples = 0
+        self.timeouts = 0
+        self.waited = 0.0
+
+    def observe(self, seconds):
+        for index in range(_BUCKETS):
+            self.counts[index] *= TIMEOUT_DECAY
+        self.counts[_bucket(seconds)] += 1
+        self.samples += 1
+
+    def weight(self):
+        return sum(self.counts)
+
+    def percentile(self, fraction):
+        """Return the latency below which `fraction` of recent samples fall."""
+        total = self.weight()
+        if total <= 0:
+            return None
+        running = 0.0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= fraction * total:
+                return _bucket_upper(index)
+        return _bucket_upper(_BUCKETS - 1)
+
+
+class TimeoutTuner:
+    """Latency trackers for every operation, and the waits derived from them.
+
+    With `path` None the tuner starts from the defaults and is never saved.
+    """
+
+    def __init__(self, path=TIMEOUT_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._trackers = {operation: LatencyTracker(counts)
+                          for operation, counts in self._load().items()}
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {operation: tracker.counts
+                    for operation, tracker in self._trackers.items()}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save timeout statistics: {e}")
+
+    def _tracker(self, operation):
+        if operation not in self._trackers:
+            self._trackers[operation] = LatencyTracker()
+        return self._trackers[operation]
+
+    def timeout(self, operation):
+        """Return how long to wait for `operation` right now."""
+        default, lower, upper = TIMEOUT_BOUNDS.get(operation, TIMEOUT_BOUNDS["element"])
+        if not ADAPTIVE_TIMEOUTS:
+            return default
+        with self._lock:
+            tracker = self._tracker(operation)
+            if tracker.weight() < TIMEOUT_MIN_SAMPLES:
+                return default
+            latency = tracker.percentile(TIMEOUT_PERCENTILE)
+        return min(upper, max(lower, latency * TIMEOUT_HEADROOM))
+
+    def observe(self, operation, seconds):
+        """Record how long a successful wait took."""
+        with self._lock:
+            self._tracker(operation).observe(seconds)
+
+    def timed_out(self, operation, waited):
+        """Record a wait that gave up after `waited` seconds.
+
+        The true latency is at least that long, so it is recorded as twice
+        the wait, which lengthens the timeout while the site is slow.
+        """
+        with self._lock:
+            tracker = self._tracker(operation)
+            tracker.observe(waited * 2)
+            tracker.timeouts += 1
+            tracker.waited += waited
+
+    def report(self):
+        """Print current timeouts and recent latencies, then save them."""
+        for operation in sorted(self._trackers):
+            with self._lock:
+                tracker = self._trackers[operation]
+                median = tracker.percentile(0.5)
+                high = tracker.percentile(TIMEOUT_PERCENTILE)
+                samples, timeouts, waited = tracker.samples, tracker.timeouts, tracker.waited
+            if not samples:
+                continue
+            print(f"Timeout '{operation}': {self.timeout(operation):.1f}s "
+                  f"(p50 {median:.2f}s, p{TIMEOUT_PERCENTILE * 100:g} {high:.2f}s, "
+                  f"{samples} waits, {timeouts} timed out, {waited:.1f}s lost)")
+        self.save()
+
+
+_tuner = None
+
+
+def get_tuner():
+    """Return the process-wide timeout tuner."""
+    global _tuner
+    if _tuner is None:
+        _tuner = TimeoutTuner()
+    return _tuner
+
+
+def use_tuner(tuner):
+    """Make `tuner` the process-wide tuner and return the previous one."""
+    global _tuner
+    previous, _tuner = _tuner, tuner
+    return previous
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import queue
+import atexit
+import argparse
+import functools
+import threading
+import contextlib
+from collections import defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from events import current_context
+
+# Write a timeline of every chapter download to this file, in Chrome's
+# trace-event format. Open it in chrome://tracing or https://ui.perfetto.dev
+# (files are loaded locally). "{pid}" is replaced with the process id, for
+# several workers on one machine. Tracing is off when empty.
+TRACE_PATH = os.getenv('TRACE_PATH', '')
+
+
+class Tracer:
+    """Streams trace events to a file from a background thread.
+
+    The file is a JSON array that is only closed at exit; trace viewers
+    accept it without the closing bracket, so a crashed run can still be
+    opened.
+    """
+
+    def __init__(self, path):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.pid = os.getpid()
+        self._named = set()
+        self._tracks = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._writer.start()
+
+    def _run(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            out = open(self.path, "w", encoding="utf-8")
+        except OSError as e:
+            print(f"Could not open trace file {self.path}: {e}")
+            return
+        out.write("[\n")
+        first = True
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            out.write(("" if first else ",\n") + json.dumps(event, default=str))
+            first = False
+            if self._queue.empty():
+                out.flush()
+        out.write("\n]\n")
+        out.close()
+
+    def _thread(self, track=None):
+        """Return the tid for the current thread or a named track, naming it once."""
+        if track is None:
+            tid, name = threading.get_ident(), threading.current_thread().name
+        else:
+            with self._lock:
+                tid = self._tracks.setdefault(track, 1_000_000 + len(self._tracks))
+            name = track
+        if tid not in self._named:
+            with self._lock:
+                self._named.add(tid)
+            self._queue.put({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                             "args": {"name": name}})
+        return tid
+
+    def complete(self, name, start, end, track=None, **args):
+        """Record a finished span from `start` to `end` (epoch seconds)."""
+        self._queue.put({"name": name, "cat": "manga_dl", "ph": "X", "pid": self.pid,
+                         "tid": self._thread(track), "ts": start * 1e6,
+                         "dur": max(0.0, end - start) * 1e6,
+                         "args": {**current_context(), **args}})
+
+    def instant(self, name, **args):
+        """Record a point in time, such as a browser restart."""
+        self._queue.put({"name": name, "cat": "manga_dl", "ph": "i", "s": "p",
+                         "pid": self.pid, "tid": self._thread(), "ts": time.time() * 1e6,
+                         "args": {**current_context(), **args}})
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(10)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """Return the process-wide tracer, or None when tracing is off."""
+    global _tracer
+    if not TRACE_PATH:
+        return None
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(TRACE_PATH)
+                atexit.register(_tracer.close)
+    return _tracer
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    """Trace the enclosed block as `name`; spans inside it nest under it."""
+    tracer = get_tracer()
+    if tracer is None:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    except BaseException as e:
+        args["error"] = e.__class__.__name__
+        raise
+    finally:
+        tracer.complete(name, started, time.time(), **args)
+
+
+def traced(name):
+    """Decorator tracing every call of a function as a span called `name`."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record(name, start, end, track=None, **args):
+    """Trace something that was timed by hand, optionally on its own track."""
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.complete(name, start, end, track, **args)
+
+
+def mark(name, **args):
+    """Trace a point in time."""
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.instant(name, **args)
+
+
+def load_trace(path):
+    """Read a trace file, including one a crashed run left unterminated."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if not text.endswith("]"):
+        text = text.rstrip(",") + "]"
+    return json.loads(text)
+
+
+def summarize(events):
+    """Print total, self and mean time per span name, largest self time first.
+
+    Self time leaves out nested spans on the same thread, so it shows where
+    the time actually went rather than which spans contain it.
+    """
+    spans = defaultdict(list)
+    for event in events:
+        if event.get("ph") == "X":
+            spans[(event["pid"], event["tid"])].append(event)
+
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for thread_spans in spans.values():
+        thread_spans.sort(key=lambda event: (event["ts"], -event["dur"]))
+        stack = []
+        for event in thread_spans:
+            while stack and stack[-1]["ts"] + stack[-1]["dur"] <= event["ts"]:
+                stack.pop()
+            if stack:
+                totals[stack[-1]["name"]][2] -= event["dur"]
+            entry = totals[event["name"]]
+            entry[0] += 1
+            entry[1] += event["dur"]
+            entry[2] += event["dur"]
+            stack.append(event)
+
+    print(f"{'span':<20}{'count':>8}{'total s':>10}{'self s':>10}{'mean ms':>10}")
+    for name, (count, total, own) in sorted(totals.items(), key=lambda item: -item[1][2]):
+        print(f"{name:<20}{count:>8}{total / 1e6:>10.1f}{own / 1e6:>10.1f}"
+              f"{total / count / 1e3:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize a trace file written with TRACE_PATH set.")
+    parser.add_argument("path")
+    parser.add_argument("--chapter", help="only spans of this chapter")
+    args = parser.parse_args()
+    events = load_trace(args.path)
+    if args.chapter is not None:
+        events = [event for event in events
+                  if str(event.get("args", {}).get("chapter")) == args.chapter]
+    summarize(events)
+
+
+if __name__ == "__main__":
+    main()
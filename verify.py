@@ -0,0 +1,194 @@
+import os
+import re
+import argparse
+
+from selenium.webdriver.common.by import By
+
+from imaging import autocrop, dhash, imaging_available, is_duplicate
+from main import (capture_and_save_screenshot, create_driver, get_total_pages,
+                  goto_page, image_source, navigate_and_prepare, page_sources,
+                  quit_driver, wait_for_element)
+from sinks import ManifestSink, load_manifest, note_source, open_sink
+
+
+class ProbeSink:
+    """Keeps the last captured frame instead of saving it."""
+
+    path = None
+
+    def __init__(self):
+        self.data = None
+
+    def write_page(self, page_number, data):
+        self.data = data
+        return f"page {page_number:03d} (probe)"
+
+
+def baseline_from_folder(folder):
+    """Build a manifest from the files of a chapter downloaded without one.
+
+    The files may have been autocropped, so unlike a manifest kept while
+    downloading, their hashes can be of cropped pages.
+    """
+    pages = {}
+    for name in sorted(os.listdir(folder)):
+        match = re.fullmatch(r"(\d+)\.(jpg|jpeg|png)", name.lower())
+        if not match:
+            continue
+        page_hash = None
+        if imaging_available():
+            with open(os.path.join(folder, name), "rb") as f:
+                page_hash = f"{dhash(f.read()):016x}"
+        pages[str(int(match.group(1)))] = {"dhash": page_hash, "source": None}
+    return {"pages": pages, "page_count": len(pages)}
+
+
+def _current_image(driver):
+    container = wait_for_element(driver, By.CSS_SELECTOR, ".ds-item.active", operation="reader")
+    if container is None:
+        raise Exception("Active container not found.")
+    return container.find_element(By.CSS_SELECTOR, ".image-horizontal")
+
+
+def verify_chapter(driver, output_path, url=None, refetch=True):
+    """Compare a downloaded chapter with the live one and re-fetch changed pages.
+
+    Pages are compared by image URL when both the manifest and the reader
+    have one, which needs no page turns. Other pages are visited and
+    compared by perceptual hash. Only chapter folders can be patched in
+    place; other outputs are just checked. Returns a summary dict.
+    """
+    manifest = load_manifest(output_path)
+    from_files = manifest is None and os.path.isdir(output_path)
+    if from_files:
+        manifest = baseline_from_folder(output_path)
+    url = url or (manifest or {}).get("url")
+    if manifest is None or not url:
+        raise ValueError(f"{output_path} has no manifest; pass its reader URL with --url")
+    refetch = refetch and os.path.isdir(output_path)
+    stored_pages = manifest["pages"]
+
+    if not navigate_and_prepare(driver, url):
+        return {"path": output_path, "missing": True}
+    live_count = get_total_pages(driver) - 1
+    sources = page_sources(driver)
+
+    changed, probe, unverifiable = [], [], 0
+    for page in range(1, live_count + 1):
+        stored = stored_pages.get(str(page))
+        live_source = sources[page - 1] if page - 1 < len(sources) else None
+        if stored is None:
+            changed.append(page)
+        elif live_source and stored.get("source"):
+            if live_source != stored["source"]:
+                changed.append(page)
+        elif stored.get("dhash") and imaging_available():
+            probe.append(page)
+        else:
+            unverifiable += 1
+
+    sink = None
+    if refetch:
+        folder = os.path.dirname(os.path.abspath(output_path))
+        content_type, number = os.path.basename(output_path.rstrip("/\\")).split("-")
+        sink = ManifestSink(open_sink(folder, content_type, int(number), output_format="folder"), url)
+        sink.set_page_count(live_count)
+
+    refetched = []
+    try:
+        for page in probe:
+            if not goto_page(driver, page):
+                print(f"Could not reach page {page:03d} to compare it")
+                continue
+            image_element = _current_image(driver)
+            frame = ProbeSink()
+            page_hash = capture_and_save_screenshot(image_element, frame, page)
+            if frame.data is None or page_hash is None:
+                unverifiable += 1
+                continue
+            stored_hash = int(stored_pages[str(page)]["dhash"], 16)
+            if is_duplicate(page_hash, stored_hash):
+                continue
+            # Compare a cropped frame too when the stored hash may be of a
+            # cropped file; frames without borders come back unchanged.
+            if from_files and is_duplicate(dhash(autocrop(frame.data)), stored_hash):
+                continue
+            changed.append(page)
+            if sink is not None:
+                note_source(sink, page, image_source(image_element), page_hash)
+                sink.write_page(page, frame.data)
+                refetched.append(page)
+
+        for page in sorted(set(changed) - set(refetched)):
+            if sink is None:
+                break
+            if not goto_page(driver, page):
+                print(f"Could not reach page {page:03d} to re-fetch it")
+                continue
+            before = sink.manifest["pages"].get(str(page))
+            capture_and_save_screenshot(_current_image(driver), sink, page)
+            if sink.manifest["pages"].get(str(page)) is not before:
+                refetched.append(page)
+    except BaseException:
+        if sink is not None:
+            sink.abort()
+        raise
+    if sink is not None:
+        sink.close()
+
+    stored_count = manifest.get("page_count", len(stored_pages))
+    return {
+        "path": output_path,
+        "stored_pages": stored_count,
+        "live_pages": live_count,
+        "changed": sorted(set(changed)),
+        "refetched": sorted(refetched),
+        "unverifiable": unverifiable,
+        "removed": sorted(int(page) for page in stored_pages if int(page) > live_count),
+    }
+
+
+def _print_summary(summary):
+    if summary.get("missing"):
+        print(f"{summary['path']}: chapter is no longer on the site")
+        return
+    line = f"{summary['path']}: {summary['live_pages']} pages live, {summary['stored_pages']} stored"
+    if summary["changed"]:
+        line += f", changed: {', '.join(str(page) for page in summary['changed'])}"
+    if summary["refetched"]:
+        line += f", re-fetched {len(summary['refetched'])}"
+    if summary["removed"]:
+        line += f", gone from the site: {', '.join(str(page) for page in summary['removed'])}"
+    if summary["unverifiable"]:
+        line += f", {summary['unverifiable']} could not be compared"
+    if not (summary["changed"] or summary["removed"]):
+        line += ", up to date"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check downloaded chapters against the site and re-fetch changed pages.")
+    parser.add_argument("chapters", nargs="+", help="chapter-NNN/volume-NNN folders or files")
+    parser.add_argument("--url", help="reader URL, for a single chapter downloaded "
+                                      "before manifests were kept")
+    parser.add_argument("--check-only", action="store_true", help="report without re-fetching")
+    parser.add_argument("--width", type=int, default=1450)
+    parser.add_argument("--height", type=int, default=1934)
+    args = parser.parse_args()
+    if args.url and len(args.chapters) > 1:
+        parser.error("--url only works with a single chapter")
+
+    driver = create_driver(args.width, args.height)
+    try:
+        for chapter in args.chapters:
+            try:
+                _print_summary(verify_chapter(driver, chapter, args.url, not args.check_only))
+            except Exception as e:
+                print(f"{chapter}: could not verify: {e}")
+    finally:
+        quit_driver(driver)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import os
+import re
+import gzip
+import time
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from jobs import JOBS_DB_PATH, SCHEDULER_WORKERS, JobStore, Scheduler
+
+# Seconds between polls of a series' chapter listing. The interval grows by
+# WATCH_BACKOFF after every poll that finds nothing new, up to
+# WATCH_MAX_INTERVAL, and drops back when a release shows up, so quiet
+# series cost next to nothing.
+WATCH_INTERVAL = float(os.getenv('WATCH_INTERVAL', '3600'))
+WATCH_MAX_INTERVAL = float(os.getenv('WATCH_MAX_INTERVAL', '86400'))
+WATCH_BACKOFF = float(os.getenv('WATCH_BACKOFF', '1.5'))
+# Listings fetched at the same time.
+WATCH_FETCHERS = int(os.getenv('WATCH_FETCHERS', '4'))
+WATCH_USER_AGENT = os.getenv('WATCH_USER_AGENT') or (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+
+
+def listing_url(base_url):
+    """Guess the series page from a reader base URL.
+
+    https://mangareader.to/read/kaiju-no-8-1187/en becomes
+    https://mangareader.to/kaiju-no-8-1187.
+    """
+    parsed = urlparse(base_url)
+    parts = [part for part in parsed.path.split("/") if part]
+    if len(parts) >= 2 and parts[0] == "read":
+        return f"{parsed.scheme}://{parsed.netloc}/{parts[1]}"
+    return base_url
+
+
+def fetch_listing(url, etag=None, last_modified=None, timeout=30):
+    """Fetch a listing page with a conditional GET.
+
+    Returns (html, etag, last_modified), with html None when the server
+    answered 304 Not Modified.
+    """
+    headers = {"User-Agent": WATCH_USER_AGENT, "Accept-Encoding": "gzip"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = response.read()
+            if response.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            charset = response.headers.get_content_charset() or "utf-8"
+            return (body.decode(charset, errors="replace"),
+                    response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, etag, last_modified
+        raise
+
+
+def released_numbers(html, base_url, content_type):
+    """Return the chapter or volume numbers linked from a listing page."""
+    path = re.escape(urlparse(base_url).path.rstrip("/"))
+    pattern = re.compile(rf'{path}/{content_type}-(\d+)\b')
+    return {int(number) for number in pattern.findall(html)}
+
+
+def poll_series(store, watch):
+    """Check one followed series and queue its new chapters.
+
+    Returns the chapter numbers that were queued.
+    """
+    series_id = watch["series_id"]
+    try:
+        html, etag, last_modified = fetch_listing(
+            watch["listing_url"], watch["etag"], watch["last_modified"])
+    except Exception as e:
+        print(f"Could not check {watch['listing_url']}: {e}")
+        store.record_poll(series_id, watch["interval"])
+        return []
+
+    if html is None:
+        print(f"{watch['listing_url']}: not modified")
+        store.record_poll(series_id, min(WATCH_MAX_INTERVAL, watch["interval"] * WATCH_BACKOFF))
+        return []
+
+    listing_hash = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    if listing_hash == watch["listing_hash"]:
+        # Servers without validators still send the same page when nothing changed
+        store.record_poll(series_id, min(WATCH_MAX_INTERVAL, watch["interval"] * WATCH_BACKOFF),
+                          etag, last_modified)
+        return []
+
+    numbers = released_numbers(html, watch["base_url"], watch["content_type"])
+    known = watch["known_number"] or 0
+    queued = store.queue_new_chapters(series_id, {n for n in numbers if n > known})
+    interval = WATCH_INTERVAL if queued else min(WATCH_MAX_INTERVAL,
+                                                watch["interval"] * WATCH_BACKOFF)
+    store.record_poll(series_id, interval, etag, last_modified, listing_hash,
+                      max(numbers) if numbers else None)
+    if queued:
+        print(f"{watch['listing_url']}: queued {watch['content_type']} "
+              f"{', '.join(str(n) for n in queued)}")
+    return queued
+
+
+def poll_due(store, fetchers=WATCH_FETCHERS):
+    """Poll every followed series that is due and return how many were queued."""
+    due = store.due_watches()
+    if not due:
+        return 0
+    with ThreadPoolExecutor(max_workers=max(1, fetchers)) as executor:
+        return sum(len(queued) for queued in
+                   executor.map(lambda watch: poll_series(store, watch), due))
+
+
+def watch_forever(store, stopping=None):
+    """Poll followed series as they come due until `stopping` is set."""
+    stopping = stopping or threading.Event()
+    while not stopping.is_set():
+        poll_due(store)
+        next_poll = store.next_watch_poll()
+        pause = 60 if next_poll is None else next_poll - time.time()
+        stopping.wait(min(60, max(1, pause)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Follow series and queue new chapters as they are released.")
+    parser.add_argument("--db", default=JOBS_DB_PATH, help="job database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    follow = commands.add_parser("follow", help="watch a queued series for new chapters")
+    follow.add_argument("series_id", type=int)
+    follow.add_argument("--listing", help="series page listing its chapters "
+                                          "(default: guessed from the reader URL)")
+
+    unfollow = commands.add_parser("unfollow", help="stop watching a series")
+    unfollow.add_argument("series_id", type=int)
+
+    commands.add_parser("poll", help="check every followed series once")
+
+    run = commands.add_parser("run", help="keep polling, optionally downloading too")
+    run.add_argument("--download", action="store_true",
+                     help="also download queued chapters as they appear")
+    run.add_argument("--workers", type=int, default=SCHEDULER_WORKERS)
+    run.add_argument("--width", type=int, default=1450)
+    run.add_argument("--height", type=int, default=1934)
+    args = parser.parse_args()
+
+    store = JobStore(args.db)
+    if args.command == "follow":
+        series = [s for s in store.series() if s["id"] == args.series_id]
+        if not series:
+            parser.error(f"No series with id {args.series_id}; add it with jobs.py first")
+        base_url = series[0]["url"].rsplit("/", 1)[0]
+        store.follow(args.series_id, args.listing or listing_url(base_url), WATCH_INTERVAL)
+    elif args.command == "unfollow":
+        store.unfollow(args.series_id)
+    elif args.command == "poll":
+        for watch in store.due_watches(now=float("inf")):
+            poll_series(store, watch)
+    else:
+        stopping = threading.Event()
+        if args.download:
+            scheduler = Scheduler(store, args.width, args.height, args.workers)
+            threading.Thread(target=scheduler.run, kwargs={"until_idle": False},
+                             daemon=True).start()
+        try:
+            watch_forever(store, stopping)
+        except KeyboardInterrupt:
+            stopping.set()
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
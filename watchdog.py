@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Hard limits in seconds. When one is exceeded the browser is killed, which
+# unblocks whatever WebDriver call was stuck, and the supervisor starts a new
+# one and resumes from the last saved page.
+NAVIGATION_DEADLINE = float(os.getenv('NAVIGATION_DEADLINE', '60'))
+CAPTURE_DEADLINE = float(os.getenv('CAPTURE_DEADLINE', '60'))
+PAGE_DEADLINE = float(os.getenv('PAGE_DEADLINE', '180'))
+CHAPTER_DEADLINE = float(os.getenv('CHAPTER_DEADLINE', '3600'))
+
+
+class WatchdogTimeout(Exception):
+    """Raised when a stage ran past its deadline and the browser was killed."""
+
+    def __init__(self, stage, seconds):
+        super().__init__(f"{stage} exceeded its {seconds:.0f}s deadline")
+        self.stage = stage
+        self.seconds = seconds
+
+
+class Watchdog:
+    """Background thread that enforces deadlines on one browser.
+
+    `on_breach(stage)` is called once, from the watchdog thread, the first
+    time any active deadline passes. It should kill the browser so that the
+    blocked WebDriver call in the worker thread fails fast.
+    """
+
+    def __init__(self, on_breach, poll_interval=0.5):
+        self.on_breach = on_breach
+        self.poll_interval = poll_interval
+        self.breached = None  # (stage, seconds) once a deadline has passed
+        self._deadlines = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.poll_interval):
+            now = time.time()
+            with self._lock:
+                if self.breached is not None:
+                    continue
+                expired = [(stage, seconds) for stage, seconds, expires
+                           in self._deadlines.values() if now > expires]
+                if not expired:
+                    continue
+                self.breached = expired[0]
+            stage, seconds = self.breached
+            print(f"Watchdog: {stage} exceeded {seconds:.0f}s, killing the browser")
+            try:
+                self.on_breach(stage)
+            except Exception as e:
+                print(f"Watchdog: error while killing the browser: {e}")
+
+    @contextmanager
+    def deadline(self, stage, seconds):
+        """Run the block under a hard deadline."""
+        token = object()
+        with self._lock:
+            self._deadlines[token] = (stage, seconds, time.time() + seconds)
+        try:
+            yield
+        except WatchdogTimeout:
+            raise
+        except Exception as e:
+            if self.breached is not None:
+                raise WatchdogTimeout(*self.breached) from e
+            raise
+        finally:
+            with self._lock:
+                self._deadlines.pop(token, None)
+        self.check()
+
+    def check(self):
+        """Raise WatchdogTimeout if the browser has been killed."""
+        if self.breached is not None:
+            raise WatchdogTimeout(*self.breached)
+
+    def stop(self):
+        self._stopped.set()
+
+
+@contextmanager
+def deadline(driver, stage, seconds):
+    """Apply a deadline through the driver's watchdog, if it has one."""
+    watchdog = getattr(driver, "watchdog", None)
+    if watchdog is None:
+        yield
+        return
+    with watchdog.deadline(stage, seconds):
+        yield
+
+
+def check(driver):
+    """Raise WatchdogTimeout if the driver's watchdog has killed it."""
+    watchdog = getattr(driver, "watchdog", None)
+    if watchdog is not None:
+        watchdog.check()
+
+
+def kill_driver(driver, grace=5):
+    """Close a possibly hung browser, killing chromedriver if quit() stalls."""
+    quitter = threading.Thread(target=driver.quit, daemon=True)
+    quitter.start()
+    quitter.join(grace)
+    process = getattr(getattr(driver, "service", None), "process", None)
+    if process is not None and process.poll() is None:
+        process.kill()
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import socket
+import argparse
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from jobs import JOBS_DB_PATH, SCHEDULER_WORKERS, JobStore, Scheduler
+
+# Shared secret sent by workers and checked by the queue server. Leave empty
+# only on a trusted network.
+QUEUE_TOKEN = os.getenv('QUEUE_TOKEN', '')
+QUEUE_PORT = int(os.getenv('QUEUE_PORT', '8765'))
+# Address the queue server listens on. Without a token it only accepts
+# connections from this machine unless --host says otherwise.
+QUEUE_HOST = os.getenv('QUEUE_HOST') or ('0.0.0.0' if QUEUE_TOKEN else '127.0.0.1')
+# Seconds a worker waits for the queue server to answer.
+QUEUE_TIMEOUT = float(os.getenv('QUEUE_TIMEOUT', '30'))
+# Times a call is retried when the queue server can't be reached, waiting
+# 1, 2, 4... seconds in between.
+QUEUE_RETRIES = int(os.getenv('QUEUE_RETRIES', '5'))
+
+# JobStore methods that workers may call over the network.
+REMOTE_METHODS = ("claim", "heartbeat", "record_page", "saved_pages",
+                  "finish", "fail", "pending")
+
+
+class QueueHandler(BaseHTTPRequestHandler):
+    """Answer POST /<method> with {"args": [...]} by calling the JobStore."""
+
+    def do_POST(self):
+        method = self.path.strip("/")
+        if QUEUE_TOKEN and self.headers.get("X-Queue-Token") != QUEUE_TOKEN:
+            return self._reply(403, {"error": "bad token"})
+        if method not in REMOTE_METHODS:
+            return self._reply(404, {"error": f"unknown method {method}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            args = json.loads(self.rfile.read(length) or b"{}").get("args", [])
+            result = getattr(self.server.store, method)(*args)
+        except Exception as e:
+            return self._reply(500, {"error": f"{e.__class__.__name__}: {e}"})
+        self._reply(200, {"result": result})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(store, host=QUEUE_HOST, port=QUEUE_PORT):
+    """Serve the job queue to workers on other machines until interrupted."""
+    server = ThreadingHTTPServer((host, port), QueueHandler)
+    server.store = store
+    print(f"Serving job queue {store.path} on {host}:{port}")
+    if not QUEUE_TOKEN and host not in ("127.0.0.1", "localhost", "::1"):
+        print("Warning: QUEUE_TOKEN is not set, anyone who can reach this port can use the queue")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class RemoteJobStore:
+    """The worker side of JobStore, forwarding calls to a queue server."""
+
+    def __init__(self, url, token=QUEUE_TOKEN, timeout=QUEUE_TIMEOUT, retries=QUEUE_RETRIES):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.retries = retries
+
+    def _call(self, method, *args):
+        """Call a JobStore method on the server, retrying while it can't be reached.
+
+        A retried call may already have run on the server. That is harmless:
+        finish() and fail() check the lease, and claim() gives back a chapter
+        the worker already holds.
+        """
+        request = urllib.request.Request(
+            f"{self.url}/{method}", data=json.dumps({"args": args}).encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Queue-Token": self.token})
+        for attempt in range(self.retries + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return json.loads(response.read())["result"]
+            except urllib.error.HTTPError as e:
+                try:
+                    message = json.loads(e.read()).get("error", e.reason)
+                except ValueError:
+                    message = e.reason
+                raise RuntimeError(f"Queue server refused {method}: {message}") from e
+            except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+                if attempt == self.retries:
+                    raise RuntimeError(f"Queue server unreachable for {method}: {e}") from e
+                delay = 2 ** attempt
+                print(f"Queue server unreachable ({e}), retrying {method} in {delay}s")
+                time.sleep(delay)
+
+    def claim(self, worker):
+        return self._call("claim", worker)
+
+    def heartbeat(self, worker):
+        return self._call("heartbeat", worker)
+
+    def record_page(self, chapter_id, page_number):
+        return self._call("record_page", chapter_id, page_number)
+
+    def saved_pages(self, chapter_id):
+        return self._call("saved_pages", chapter_id)
+
+    def finish(self, job, success, pages):
+        return self._call("finish", job, success, pages)
+
+    def fail(self, job, error):
+        return self._call("fail", job, error)
+
+    def pending(self):
+        return self._call("pending")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Share one job queue between download workers on several machines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    server = commands.add_parser("serve", help="serve the job database to workers")
+    server.add_argument("--db", default=JOBS_DB_PATH, help="job database path")
+    server.add_argument("--host", default=QUEUE_HOST)
+    server.add_argument("--port", type=int, default=QUEUE_PORT)
+
+    work = commands.add_parser("work", help="download chapters from a queue server")
+    work.add_argument("queue", help="queue server URL, e.g. http://storage-host:8765")
+    work.add_argument("--workers", type=int, default=SCHEDULER_WORKERS)
+    work.add_argument("--width", type=int, default=1450)
+    work.add_argument("--height", type=int, default=1934)
+    work.add_argument("--wait", action="store_true",
+                      help="keep polling for new chapters instead of exiting when idle")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        store = JobStore(args.db)
+        serve(store, args.host, args.port)
+        store.close()
+    else:
+        Scheduler(RemoteJobStore(args.queue), args.width, args.height,
+                  args.workers).run(until_idle=not args.wait)
+
+
+if __name__ == "__main__":
+    main()